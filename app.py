@@ -1,4 +1,4 @@
-from flask import Flask, render_template, request, send_file, redirect, url_for, jsonify, make_response, flash, session, send_from_directory
+from flask import Flask, render_template, request, send_file, redirect, url_for, jsonify, make_response, flash, session, send_from_directory, Response, stream_with_context, g
 import os
 import shutil
 import uuid
@@ -7,27 +7,61 @@ from werkzeug.utils import secure_filename
 from datetime import datetime
 import io
 import re
+import hashlib
 import json
 import base64
 import requests
 from dotenv import load_dotenv
 import difflib
-import google.generativeai as genai
 import secrets
+import click
+import tempfile
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaFileUpload, MediaIoBaseDownload
-import tempfile
-from database import init_db, db_connection
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor, TimeoutError as FuturesTimeoutError, wait
+import httplib2
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.http import HttpRequest
+from zip_stream import ZipStream
+from database import init_db, get_pool, load_report, report_version, save_report, sections_from_form, list_reports, get_conversion, save_conversion, flush_due_conversion_hits
+from drive_cache import FolderManifestCache, FOLDER_MIME_TYPE
+from drive_batch import DriveBatch
+from image_cache import LocalImageCache
+from upload_queue import UploadQueue
+from latex_compiler import LatexCompiler, CompileError
+from artifact_store import RenderedArtifactStore
+from asset_registry import AssetRegistry
+from latex_template import CompiledTemplate
+from conversion_cache import ConversionCache
+from text_to_latex import convert_simple, sanitize_latex, stable_latex_prefix
+import logging
+import telemetry
+from telemetry import get_logger, span
+
+log = get_logger('app')
 
 try:
     from PIL import Image
 except ImportError:
-    print("WARNING: PIL/Pillow not installed. Image processing will be limited.")
+    log.warning("PIL/Pillow not installed. Image processing will be limited.")
     Image = None
 
 load_dotenv()
 
+DRIVE_HTTP_TIMEOUT = int(os.getenv('DRIVE_HTTP_TIMEOUT', '60'))
+_drive_http = threading.local()
+
+class TimedHttpRequest(HttpRequest):
+    """HttpRequest Drive yang mencatat setiap execute() sebagai span 'drive'"""
+
+    def execute(self, *args, **kwargs):
+        with span('drive', self.methodId or ''):
+            return super().execute(*args, **kwargs)
+
 # Inisialisasi Google Drive untuk gambar
 def init_drive_client():
     credentials_json = os.getenv('GOOGLE_CREDENTIALS')
@@ -36,63 +70,235 @@ def init_drive_client():
         credentials_dict,
         scopes=['https://www.googleapis.com/auth/drive']
     )
-    return build('drive', 'v3', credentials=credentials)
 
-drive_client = init_drive_client()
+    def build_request(http, *args, **kwargs):
+        # httplib2 tidak thread-safe: setiap thread memakai koneksi HTTP sendiri
+        thread_http = getattr(_drive_http, 'http', None)
+        if thread_http is None:
+            thread_http = AuthorizedHttp(credentials, http=httplib2.Http(timeout=DRIVE_HTTP_TIMEOUT))
+            _drive_http.http = thread_http
+        return TimedHttpRequest(thread_http, *args, **kwargs)
+
+    # Dokumen discovery statis yang dibundel google-api-python-client, tanpa fetch jaringan saat build
+    return build('drive', 'v3', credentials=credentials, requestBuilder=build_request,
+                 static_discovery=True, cache_discovery=False)
+
+_drive_client = None
+_drive_client_lock = threading.Lock()
+
+def get_drive_client():
+    """Client Drive dibuat saat pertama dipakai, bukan saat import (cold start), lalu dipakai bersama"""
+    global _drive_client
+    if _drive_client is None:
+        with _drive_client_lock:
+            if _drive_client is None:
+                with span('startup', 'drive_client'):
+                    _drive_client = init_drive_client()
+    return _drive_client
+
 folder_id = os.getenv('GOOGLE_DRIVE_FOLDER_ID')
 
+def list_folder_files(parent_folder_id):
+    """Ambil seluruh isi folder Google Drive dengan paginasi"""
+    query = f"'{parent_folder_id}' in parents and trashed = false"
+    files = []
+    page_token = None
+    while True:
+        response = get_drive_client().files().list(
+            q=query,
+            spaces='drive',
+            fields='nextPageToken, files(id, name, mimeType)',
+            pageSize=1000,
+            pageToken=page_token
+        ).execute()
+        files.extend(response.get('files', []))
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            return files
+
+# Cache manifest folder Drive supaya lookup folder/file tidak selalu memanggil files().list()
+drive_manifest = FolderManifestCache(
+    list_folder_files,
+    ttl=int(os.getenv('DRIVE_MANIFEST_TTL', '300')),
+    max_folders=int(os.getenv('DRIVE_MANIFEST_MAX_FOLDERS', '256'))
+)
+
+# Operasi metadata Drive yang independen dikirim sebagai batch request (maks. 100 per round trip)
+drive_batch = DriveBatch(
+    get_drive_client,
+    max_batch=int(os.getenv('DRIVE_BATCH_SIZE', '100')),
+    max_attempts=int(os.getenv('DRIVE_BATCH_MAX_ATTEMPTS', '4')),
+    backoff=float(os.getenv('DRIVE_BATCH_BACKOFF', '1'))
+)
+
+def find_folder(filename):
+    """ID folder laporan di Drive tanpa membuatnya; None jika belum ada"""
+    return drive_manifest.lookup(folder_id, filename, FOLDER_MIME_TYPE)
+
+# Pembuatan folder yang sedang berjalan per nama: worker upload paralel untuk laporan yang sama
+# menunggu folder yang sama, bukan membuat folder duplikat
+_folder_creates = {}
+_folder_create_lock = threading.Lock()
+
 def find_or_create_folder(filename):
-    query = f"'{folder_id}' in parents and name = '{filename}' and mimeType = 'application/vnd.google-apps.folder' and trashed = false"
-    response = drive_client.files().list(q=query, spaces='drive', fields='files(id)').execute()
-    folders = response.get('files', [])
-    if folders:
-        return folders[0]['id']
-    folder_metadata = {
-        'name': filename,
-        'mimeType': 'application/vnd.google-apps.folder',
-        'parents': [folder_id]
-    }
-    folder = drive_client.files().create(body=folder_metadata, fields='id').execute()
-    return folder['id']
+    existing_id = find_folder(filename)
+    if existing_id:
+        return existing_id
+
+    with _folder_create_lock:
+        future = _folder_creates.get(filename)
+        owner = future is None
+        if owner:
+            future = _folder_creates[filename] = Future()
+    if not owner:
+        return future.result(timeout=app.config['DRIVE_FETCH_TIMEOUT'])
+
+    try:
+        # Cek ulang: pembuat sebelumnya bisa saja selesai di antara lookup pertama dan lock
+        new_id = find_folder(filename)
+        if not new_id:
+            folder_metadata = {
+                'name': filename,
+                'mimeType': FOLDER_MIME_TYPE,
+                'parents': [folder_id]
+            }
+            folder = get_drive_client().files().create(body=folder_metadata, fields='id').execute()
+            new_id = folder['id']
+            drive_manifest.remember(folder_id, filename, new_id, FOLDER_MIME_TYPE)
+        future.set_result(new_id)
+        return new_id
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _folder_create_lock:
+            _folder_creates.pop(filename, None)
 
 def find_file_in_folder(filename, parent_folder_id):
-    query = f"'{parent_folder_id}' in parents and name = '{filename}' and trashed = false"
-    response = drive_client.files().list(q=query, spaces='drive', fields='files(id)').execute()
-    files = response.get('files', [])
-    return files[0]['id'] if files else None
+    return drive_manifest.lookup(parent_folder_id, filename)
 
 # Gemini API key
 GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY')
-GEMINI_AVAILABLE = True
-
-if GEMINI_API_KEY and GEMINI_AVAILABLE:
+GEMINI_MODEL_NAME = os.getenv('GEMINI_MODEL', 'gemini-2.0-flash')
+_gemini_model = None
+_gemini_initialized = False
+_gemini_lock = threading.Lock()
+
+def init_gemini_model():
+    if not GEMINI_API_KEY:
+        log.warning("Gemini API key not found or Gemini not available.")
+        return None
+    # Import google.generativeai (gRPC/protobuf) cukup lama, jadi ditunda sampai Gemini benar-benar dipakai
+    import google.generativeai as genai
     try:
         genai.configure(api_key=GEMINI_API_KEY)
-        print("Gemini API configured successfully.")
+        log.info("Gemini API configured successfully.")
     except Exception as e:
-        print(f"Failed to configure Gemini API: {e}")
-        GEMINI_AVAILABLE = False
-else:
-    print("Gemini API key not found or Gemini not available.")
-    GEMINI_AVAILABLE = False
-
-if GEMINI_AVAILABLE:
+        log.error("Failed to configure Gemini API: %s", e)
+        return None
     try:
-        model = genai.GenerativeModel('gemini-2.0-flash')
-        print("Gemini model 'gemini-2.0-flash' initialized successfully.")
+        model = genai.GenerativeModel(GEMINI_MODEL_NAME)
+        log.info("Gemini model '%s' initialized successfully.", GEMINI_MODEL_NAME)
+        return model
     except Exception as e:
-        print(f"Failed to initialize Gemini model: {e}")
-        GEMINI_AVAILABLE = False
-else:
-    model = None
+        log.error("Failed to initialize Gemini model: %s", e)
+        return None
+
+def get_gemini_model():
+    """Model Gemini, dibuat sekali saat pertama dipakai; None jika API key tidak ada atau inisialisasi gagal"""
+    global _gemini_model, _gemini_initialized
+    if not _gemini_initialized:
+        with _gemini_lock:
+            if not _gemini_initialized:
+                with span('startup', 'gemini_model'):
+                    _gemini_model = init_gemini_model()
+                _gemini_initialized = True
+    return _gemini_model
 
 app = Flask(__name__)
 app.secret_key = secrets.token_hex(16)
 app.config['UPLOAD_FOLDER'] = 'static/uploads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
 
-# Inisialisasi database Supabase (PostgreSQL)
-init_db()
+def default_cache_dir():
+    """Direktori cache bawaan: static/uploads/.cache, atau di direktori temp jika static tidak bisa
+    ditulis (mis. di Vercel, yang hanya mengizinkan menulis ke /tmp)"""
+    if os.getenv('VERCEL') or not os.access(app.config['UPLOAD_FOLDER'], os.W_OK):
+        return os.path.join(tempfile.gettempdir(), 'laporan-cache')
+    return os.path.join(app.config['UPLOAD_FOLDER'], '.cache')
+
+app.config['IMAGE_CACHE_DIR'] = os.getenv('IMAGE_CACHE_DIR') or default_cache_dir()
+app.config['IMAGE_CACHE_MAX_BYTES'] = int(os.getenv('IMAGE_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+app.config['IMAGE_CACHE_MAX_AGE'] = int(os.getenv('IMAGE_CACHE_MAX_AGE', str(365 * 24 * 3600)))
+app.config['DRIVE_FETCH_CONCURRENCY'] = int(os.getenv('DRIVE_FETCH_CONCURRENCY', '8'))
+app.config['DRIVE_FETCH_TIMEOUT'] = float(os.getenv('DRIVE_FETCH_TIMEOUT', '30'))
+
+# Cache gambar lokal untuk /get-image supaya preview tidak selalu download dari Drive
+image_cache = LocalImageCache(app.config['IMAGE_CACHE_DIR'], app.config['IMAGE_CACHE_MAX_BYTES'])
+
+# Aset template yang dirujuk LATEX_TEMPLATE, satu salinan bersama untuk semua laporan.
+# File ini tidak ada di repo; setelah deploy pertama isi folder bersama di Drive dengan
+# `flask --app app upload-assets` (dari static/) atau `flask --app app upload-assets --from-report <laporan>`.
+# Selama salinan bersama belum ada, salinan lama di folder laporan tetap dipakai.
+TEMPLATE_ASSETS = {'lambang ugm.png': 'image/png'}
+asset_registry = AssetRegistry(
+    TEMPLATE_ASSETS,
+    folder=os.getenv('TEMPLATE_ASSET_FOLDER', '_template_assets'),
+    local_dir=app.static_folder,
+    image_cache=image_cache,
+    fetch=lambda filepath: fetch_image_to_cache(filepath),
+    negative_ttl=int(os.getenv('TEMPLATE_ASSET_MISS_TTL', '3600'))
+)
+
+# Kompilasi PDF di server (butuh TeX engine lokal, mis. TeX Live dengan mylatexformat)
+latex_compiler = LatexCompiler(
+    os.getenv('LATEX_CACHE_DIR', os.path.join(app.config['IMAGE_CACHE_DIR'], 'latex')),
+    engine=os.getenv('LATEX_ENGINE', 'pdflatex'),
+    workers=int(os.getenv('LATEX_WORKERS', '2')),
+    timeout=float(os.getenv('LATEX_TIMEOUT', '60'))
+)
+
+# Hasil render .tex per laporan di disk, dipakai bersama semua worker; diinvalidasi saat laporan disimpan
+tex_store = RenderedArtifactStore(
+    os.getenv('TEX_ARTIFACT_DIR', os.path.join(app.config['IMAGE_CACHE_DIR'], 'tex')),
+    max_objects=int(os.getenv('TEX_ARTIFACT_MAX', '500'))
+)
+
+# Pool bersama untuk download Drive paralel (ZIP gambar), dibatasi DRIVE_FETCH_CONCURRENCY
+drive_fetch_pool = ThreadPoolExecutor(
+    max_workers=app.config['DRIVE_FETCH_CONCURRENCY'],
+    thread_name_prefix='drive-fetch'
+)
+
+# Skema database Supabase (PostgreSQL) tidak lagi dibuat saat import. Jalankan `flask --app app migrate`
+# (dengan POSTGRES_URL produksi) sebelum deploy yang menaikkan database.SCHEMA_VERSION; build Vercel
+# tidak menjalankannya. Instance dengan skema lama gagal di pemakaian database pertama dengan
+# SchemaOutdatedError yang menyebutkan perintah ini, bukan dengan error kolom yang membingungkan.
+@app.cli.command('migrate')
+def migrate_command():
+    """Buat/migrasi tabel database"""
+    init_db()
+    log.info("Database schema is up to date")
+
+# Timing per request: jumlah span (db, drive, gemini, ...) per request masuk ke /metrics
+@app.before_request
+def start_request_trace():
+    telemetry.begin_request()
+
+@app.after_request
+def record_request_status(response):
+    g.response_status = response.status_code
+    return response
+
+@app.teardown_request
+def finish_request_trace(exc):
+    # Untuk response streaming, teardown baru berjalan setelah generator selesai
+    status = 500 if exc is not None else g.get('response_status', 500)
+    telemetry.end_request(request.endpoint or 'unknown', request.method, status)
+
+@app.teardown_request
+def flush_conversion_hits_after_request(exc):
+    flush_due_conversion_hits()
 
 # Mapping matkul ke dosen
 MATKUL_DOSEN = {
@@ -215,9 +421,10 @@ LATEX_TEMPLATE = r"""\documentclass[a4paper,oneside,12pt]{book}
     \renewcommand{\headrulewidth}{0pt}
 }
 
+%endofdump
 % Judul, Penulis, Tanggal
-\title{Laporan Praktikum \\ MATKUL \\ Pertemuan PERTEMUAN \\ JUDUL}
-\date{TANGGAL}
+\title{Laporan Praktikum \\ <<MATKUL>> \\ Pertemuan <<PERTEMUAN>> \\ <<JUDUL>>}
+\date{<<TANGGAL>>}
 
 % Penyesuaian nama Daftar Pustaka dan Daftar Isi
 \renewcommand\bibname{Daftar Pustaka}
@@ -239,15 +446,15 @@ LATEX_TEMPLATE = r"""\documentclass[a4paper,oneside,12pt]{book}
 \begin{Large}
 \textbf{Disusun oleh:} \\
 \vspace{0.5cm}
-NAMA \\
-NPM \\
-KELAS \\
+<<NAMA>> \\
+<<NPM>> \\
+<<KELAS>> \\
 \end{Large}
 \vspace{1cm}
 \begin{Large}
 \textbf{Dosen Pengampu:} \\
 \vspace{0.5cm}
-DOSEN \\
+<<DOSEN>> \\
 \end{Large}
 \vspace{1cm}
 \thedate
@@ -262,60 +469,46 @@ DOSEN \\
 \chapter*{Tujuan Praktikum}
 \addcontentsline{toc}{chapter}{Tujuan Praktikum}
 \begin{enumerate}
-TUJUAN
+<<TUJUAN>>
 \end{enumerate}
 
 \chapter*{Dasar Teori}
 \addcontentsline{toc}{chapter}{Dasar Teori}
 \setcounter{chapter}{2}
 \setcounter{section}{0}
-DASAR_TEORI
+<<DASAR_TEORI>>
 
 \chapter*{Hasil dan Pembahasan}
 \addcontentsline{toc}{chapter}{Hasil dan Pembahasan}
 \setcounter{chapter}{3}
 \setcounter{section}{0}
-HASIL_PEMBAHASAN
+<<HASIL_PEMBAHASAN>>
 
 \chapter*{Kesimpulan}
 \addcontentsline{toc}{chapter}{Kesimpulan}
 \setcounter{chapter}{4}
 \setcounter{section}{0}
-KESIMPULAN
+<<KESIMPULAN>>
 
 \newpage
 \addcontentsline{toc}{chapter}{Daftar Pustaka}
 \begin{thebibliography}{99}
-REFERENSI
+<<REFERENSI>>
 \end{thebibliography}
 
 \end{document}
 """
 
+# Template di-parse sekali saat startup menjadi potongan literal dan slot <<NAMA_SLOT>>
+COMPILED_LATEX_TEMPLATE = CompiledTemplate(LATEX_TEMPLATE)
+
 # Fungsi utilitas
 def get_filenames():
     """Mendapatkan daftar filename dari Supabase (PostgreSQL)"""
     try:
-        with db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT filename, metadata FROM laporan')
-            laporans = cursor.fetchall()
-            filenames = []
-            for laporan in laporans:
-                metadata = json.loads(laporan['metadata']) if laporan['metadata'] else {}
-                filenames.append({
-                    'filename': laporan['filename'],
-                    'nama': metadata.get('nama', ''),
-                    'judul': metadata.get('judul', ''),
-                    'matkul': metadata.get('matkul', ''),
-                    'tanggal': metadata.get('tanggal', ''),
-                    'last_modified': metadata.get('tanggal', '')  # Gunakan tanggal sebagai proxy
-                })
-
-        filenames.sort(key=lambda x: x['last_modified'], reverse=True)
-        return filenames
+        return list_reports()
     except Exception as e:
-        print(f"❌ Error getting filenames from Supabase: {e}")
+        log.error("Error getting filenames from Supabase: %s", e)
         return []
 
 def standardize_filename(name, npm, matkul, judul):
@@ -340,115 +533,235 @@ def process_referensi(referensi_text):
     items = [line.strip() for line in lines if line.strip()]
     return '\n'.join(items) if items else '-'
 
-def generate_latex_for_dasar_teori(sections):
-    """Generate LaTeX untuk dasar teori"""
-    if not sections:
-        return ""
-        
-    print(f"Generating LaTeX for {len(sections)} dasar teori sections")
-    content = ""
-    
-    for section_id, section in sorted(sections.items(), key=lambda x: int(x[0]) if x[0].isdigit() else float('inf')):
-        title = section.get('title', '')
-        print(f"Processing dasar teori section {section_id}: {title}")
-        
-        raw_content = section.get('content', '')
-        image = section.get('image', '')
-        
+# Cache fragmen LaTeX per section, dikunci dengan hash isi section.
+# Naikkan FRAGMENT_VERSION jika format fragmen berubah supaya fragmen tersimpan tidak dipakai lagi.
+FRAGMENT_VERSION = '2'
+FRAGMENT_CACHE_SIZE = int(os.getenv('FRAGMENT_CACHE_SIZE', '4096'))
+_fragment_cache = OrderedDict()
+_fragment_lock = threading.Lock()
+
+def fragment_hash(kind, section_id, *fields):
+    """Hash isi section dengan prefix FRAGMENT_VERSION (`<versi>:<sha1>`)"""
+    sha = hashlib.sha1(f"{FRAGMENT_VERSION}\0{kind}\0{section_id}".encode('utf-8'))
+    for field in fields:
+        sha.update(b'\0' + str(field).encode('utf-8'))
+    return f"{FRAGMENT_VERSION}:{sha.hexdigest()}"
+
+def stored_fragment(section):
+    """Fragmen yang tersimpan di database bersama section, tanpa menghitung hash isi lagi:
+    save_report selalu menulis ulang fragmen section yang isinya berubah"""
+    if section.get('latex_fragment') is not None and (section.get('fragment_hash') or '').startswith(f"{FRAGMENT_VERSION}:"):
+        return section['latex_fragment']
+    return None
+
+def cached_fragment(key, render):
+    """Ambil fragmen dari cache proses; render jika belum ada"""
+    with _fragment_lock:
+        fragment = _fragment_cache.get(key)
+        if fragment is not None:
+            _fragment_cache.move_to_end(key)
+            return fragment
+    fragment = render()
+    with _fragment_lock:
+        _fragment_cache[key] = fragment
+        while len(_fragment_cache) > FRAGMENT_CACHE_SIZE:
+            _fragment_cache.popitem(last=False)
+    return fragment
+
+def render_dasar_teori_fragment(section_id, section):
+    title = section.get('title', '')
+    raw_content = section.get('content', '')
+    image = section.get('image', '')
+
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("Processing dasar teori section %s: %s", section_id, title)
         if raw_content:
-            print(f"Section {section_id} content: {len(raw_content)} chars, {raw_content.count('\\')} backslashes")
+            log.debug("Section %s content: %d chars, %d backslashes", section_id, len(raw_content), raw_content.count('\\'))
         else:
-            print(f"Section {section_id} has no content!")
-        
-        if title:
-            content += f"\\section{{{title}}}\n"
-        
-        if raw_content:
-            content += raw_content + "\n\n"
-            
-            if "begin{" in raw_content and "\\begin{" not in raw_content:
-                print(f"WARNING: LaTeX tags missing backslashes in section {section_id}")
-                
-        if image:
-            filename_img = os.path.basename(image)
-            content += f"\\begin{{figure}}[H]\n" \
-                       f"\\centering\n" \
-                       f"\\customfbox{{1pt}}{{\n" \
-                       f"    \\includegraphics[width=0.78\\textwidth, keepaspectratio]{{{filename_img}}}\n" \
-                       f"}}\n" \
-                       f"\\caption{{{title}}}\n" \
-                       f"\\label{{fig:{section_id}}}\n" \
-                       f"\\end{{figure}}\n\n"
-            print(f"Added image {filename_img} for section {section_id}")
-            
+            log.debug("Section %s has no content!", section_id)
+
+    content = ""
+    if title:
+        content += f"\\section{{{title}}}\n"
+
+    if raw_content:
+        content += raw_content + "\n\n"
+
+        if "begin{" in raw_content and "\\begin{" not in raw_content:
+            log.warning("LaTeX tags missing backslashes in section %s", section_id)
+
+    if image:
+        filename_img = os.path.basename(image)
+        content += f"\\begin{{figure}}[H]\n" \
+                   f"\\centering\n" \
+                   f"\\customfbox{{1pt}}{{\n" \
+                   f"    \\includegraphics[width=0.78\\textwidth, keepaspectratio]{{{filename_img}}}\n" \
+                   f"}}\n" \
+                   f"\\caption{{{title}}}\n" \
+                   f"\\label{{fig:{section_id}}}\n" \
+                   f"\\end{{figure}}\n\n"
+        log.debug("Added image %s for section %s", filename_img, section_id)
     return content
 
-def generate_latex_for_sections(sections):
-    """Generate LaTeX untuk hasil dan pembahasan"""
+def dasar_teori_fragment(section_id, section):
+    """Fragmen LaTeX satu section dasar teori beserta hash-nya"""
+    fragment = stored_fragment(section)
+    if fragment is not None:
+        return section['fragment_hash'], fragment
+    key = fragment_hash('dasar_teori', section_id, section.get('title', ''), section.get('content', ''), section.get('image', ''))
+    return key, cached_fragment(key, lambda: render_dasar_teori_fragment(section_id, section))
+
+def render_subsection_fragment(subsection):
+    latex = f"\\subsection{{{subsection['title']}}}\n\n"
+
+    if subsection['code']:
+        latex += f"\\begin{{lstlisting}}[language=Python, style=pythonstyle]\n{subsection['code']}\n\\end{{lstlisting}}\n\n"
+        log.debug("Added code for subsection %s", subsection['id'])
+
+    if subsection['image']:
+        img_filename = os.path.basename(subsection['image'])
+        latex += f"\\begin{{figure}}[H]\n" \
+                f"\\centering\n" \
+                f"\\customfbox{{1pt}}{{\n" \
+                f"    \\includegraphics[width=0.78\\textwidth, keepaspectratio]{{{img_filename}}}\n" \
+                f"}}\n" \
+                f"\\caption{{{subsection['title']}}}\n" \
+                f"\\label{{fig:{subsection['id']}}}\n" \
+                f"\\end{{figure}}\n\n"
+        log.debug("Added image %s for subsection %s", img_filename, subsection['id'])
+
+    if subsection['penjelasan']:
+        latex += f"\\textbf{{Penjelasan:}} {subsection['penjelasan']}\n\n"
+        log.debug("Added explanation for subsection %s", subsection['id'])
+    return latex
+
+def subsection_fragment(section_id, data):
+    """Fragmen LaTeX satu subsection hasil dan pembahasan beserta hash-nya"""
+    fragment = stored_fragment(data)
+    if fragment is not None:
+        return data['fragment_hash'], fragment
+    subsection = {
+        'id': section_id,
+        'title': data['title'],
+        'code': data.get('code', ''),
+        'image': data.get('image', ''),
+        'penjelasan': data.get('penjelasan', '')
+    }
+    key = fragment_hash('subsection', section_id, subsection['title'], subsection['code'], subsection['image'], subsection['penjelasan'])
+    return key, cached_fragment(key, lambda: render_subsection_fragment(subsection))
+
+def section_fragment(section, penjelasan=''):
+    """(fragment_hash, latex_fragment) untuk Section database; dipanggil save_report hanya untuk
+    section yang berubah"""
+    if section.type == 'dasar_teori':
+        return dasar_teori_fragment(section.section_id.replace('dasar_teori_', ''), {
+            'title': section.title or '', 'content': section.content or '', 'image': section.image or ''
+        })
+    if section.type == 'subsection':
+        return subsection_fragment(section.section_id, {
+            'title': section.title, 'code': section.content or '', 'image': section.image or '', 'penjelasan': penjelasan or ''
+        })
+    return None, None
+
+def iter_latex_for_dasar_teori(sections):
+    """Fragmen LaTeX dasar teori, satu section per potongan"""
     if not sections:
-        return ""
-        
-    print(f"Generating LaTeX for {len(sections)} sections")
-    latex = ""
+        return
+    for section_id, section in sorted(sections.items(), key=lambda x: int(x[0]) if x[0].isdigit() else float('inf')):
+        yield dasar_teori_fragment(section_id, section)[1]
+
+def generate_latex_for_dasar_teori(sections):
+    """Generate LaTeX untuk dasar teori"""
+    return "".join(iter_latex_for_dasar_teori(sections))
+
+def group_subsections(sections):
+    """Kelompokkan subsection di bawah section induknya, urut sesuai form"""
     section_groups = {}
-    
     for id, data in sections.items():
         if data.get('type') == 'section':
             section_groups[id] = {'title': data['title'], 'subsections': []}
-            print(f"Found main section {id}: {data['title']}")
-            
+
     for id, data in sections.items():
         if data.get('type') == 'subsection':
             parent_id = data.get('parent_section', next(iter(section_groups)) if section_groups else 'default')
             if parent_id not in section_groups:
                 section_groups[parent_id] = {'title': 'Latihan', 'subsections': []}
-                print(f"Created default parent section for subsection {id}")
-                
-            section_groups[parent_id]['subsections'].append({
-                'id': id,
-                'title': data['title'], 
-                'code': data.get('code', ''),
-                'image': data.get('image', ''),
-                'penjelasan': data.get('penjelasan', '')
-            })
-            print(f"Added subsection {id} to parent {parent_id}")
-    
-    for section_id, section_data in section_groups.items():
+                log.debug("Created default parent section for subsection %s", id)
+            section_groups[parent_id]['subsections'].append((id, data))
+    return section_groups
+
+def iter_latex_for_sections(sections):
+    """Fragmen LaTeX hasil dan pembahasan: judul section lalu subsection-nya satu per satu"""
+    if not sections:
+        return
+    empty = True
+    for section_data in group_subsections(sections).values():
         if not section_data['subsections']:
-            print(f"Section {section_id} has no subsections, skipping")
             continue
-            
-        latex += f"\\section{{{section_data['title']}}}\n\n"
-        print(f"Adding section {section_id} with {len(section_data['subsections'])} subsections")
-        
-        for subsection in section_data['subsections']:
-            latex += f"\\subsection{{{subsection['title']}}}\n\n"
-            
-            if subsection['code']:
-                latex += f"\\begin{{lstlisting}}[language=Python, style=pythonstyle]\n{subsection['code']}\n\\end{{lstlisting}}\n\n"
-                print(f"Added code for subsection {subsection['id']}")
-                
-            if subsection['image']:
-                img_filename = os.path.basename(subsection['image'])
-                latex += f"\\begin{{figure}}[H]\n" \
-                        f"\\centering\n" \
-                        f"\\customfbox{{1pt}}{{\n" \
-                        f"    \\includegraphics[width=0.78\\textwidth, keepaspectratio]{{{img_filename}}}\n" \
-                        f"}}\n" \
-                        f"\\caption{{{subsection['title']}}}\n" \
-                        f"\\label{{fig:{subsection['id']}}}\n" \
-                        f"\\end{{figure}}\n\n"
-                print(f"Added image {img_filename} for subsection {subsection['id']}")
-                
-            if subsection['penjelasan']:
-                latex += f"\\textbf{{Penjelasan:}} {subsection['penjelasan']}\n\n"
-                print(f"Added explanation for subsection {subsection['id']}")
-                
-    if not latex:
-        print("WARNING: No content generated for LaTeX sections")
-        latex = "\\section{Hasil dan Pembahasan}\nTidak ada data hasil dan pembahasan.\n\n"
-        
-    return latex
+        empty = False
+        yield f"\\section{{{section_data['title']}}}\n\n"
+        for subsection_id, data in section_data['subsections']:
+            yield subsection_fragment(subsection_id, data)[1]
+
+    if empty:
+        log.warning("No content generated for LaTeX sections")
+        yield "\\section{Hasil dan Pembahasan}\nTidak ada data hasil dan pembahasan.\n\n"
+
+def generate_latex_for_sections(sections):
+    """Generate LaTeX untuk hasil dan pembahasan"""
+    return "".join(iter_latex_for_sections(sections))
+
+def clean_text(text):
+    if not text:
+        return ''
+    text = text.strip()
+    text = re.sub(r'\n\s*\n+', '\n', text)
+    return text
+
+def parse_form_sections(form):
+    """Ambil section dasar teori dan hasil pembahasan dari field form editor.
+    Mengembalikan (dasar_teori_sections, main_sections)."""
+    # Process Dasar Teori Sections
+    dasar_teori_sections = {}
+    for key in form:
+        if key.startswith('dasar_teori_section_id_'):
+            section_id = form[key]
+            content_key = f'dasar_teori_section_content_{section_id}'
+            raw_content = form.get(content_key, '').strip()
+            raw_content = clean_text(raw_content)
+            dasar_teori_sections[section_id] = {
+                'title': form.get(f'dasar_teori_section_title_{section_id}', '').strip(),
+                'content': raw_content,
+                'image': form.get(f'dasar_teori_section_image_{section_id}', '').strip()
+            }
+
+    # Process Main Sections
+    main_sections = {}
+    for key in form:
+        if key.startswith('section_type_'):
+            section_id = key[len('section_type_'):]
+            section_type = form[key]
+            main_sections[section_id] = {
+                'type': section_type,
+                'title': form.get(f'section_title_{section_id}', '').strip()
+            }
+            if section_type == 'subsection':
+                parent_key = f'parent_section_{section_id}'
+                code_key = f'code_{section_id}'
+                penjelasan_key = f'penjelasan_{section_id}'
+                code_content = form.get(code_key, '').strip()
+                penjelasan_content = form.get(penjelasan_key, '').strip()
+                code_content = clean_text(code_content)
+                penjelasan_content = clean_text(penjelasan_content)
+                if parent_key in form:
+                    main_sections[section_id]['parent_section'] = form[parent_key]
+                if code_key in form:
+                    main_sections[section_id]['code'] = code_content
+                if penjelasan_key in form:
+                    main_sections[section_id]['penjelasan'] = penjelasan_content
+                main_sections[section_id]['image'] = form.get(f'image_{section_id}', '').strip()
+
+    return dasar_teori_sections, main_sections
 
 # Routes
 @app.route('/favicon.ico')
@@ -473,13 +786,6 @@ def index():
         edit_mode = request.form.get('edit_mode') == 'true'
         original_filename = request.form.get('original_filename', '')
 
-        def clean_text(text):
-            if not text:
-                return ''
-            text = text.strip()
-            text = re.sub(r'\n\s*\n+', '\n', text)
-            return text
-
         tujuan = clean_text(tujuan)
         kesimpulan = clean_text(kesimpulan)
         referensi = clean_text(referensi)
@@ -490,45 +796,7 @@ def index():
 
         filename = standardize_filename(nama, npm, matkul, judul)
 
-        # Process Dasar Teori Sections
-        dasar_teori_sections = {}
-        for key in request.form:
-            if key.startswith('dasar_teori_section_id_'):
-                section_id = request.form[key]
-                content_key = f'dasar_teori_section_content_{section_id}'
-                raw_content = request.form.get(content_key, '').strip()
-                raw_content = clean_text(raw_content)
-                dasar_teori_sections[section_id] = {
-                    'title': request.form.get(f'dasar_teori_section_title_{section_id}', '').strip(),
-                    'content': raw_content,
-                    'image': request.form.get(f'dasar_teori_section_image_{section_id}', '').strip()
-                }
-
-        # Process Main Sections
-        main_sections = {}
-        for key in request.form:
-            if key.startswith('section_type_'):
-                section_id = key[len('section_type_'):]
-                section_type = request.form[key]
-                main_sections[section_id] = {
-                    'type': section_type,
-                    'title': request.form.get(f'section_title_{section_id}', '').strip()
-                }
-                if section_type == 'subsection':
-                    parent_key = f'parent_section_{section_id}'
-                    code_key = f'code_{section_id}'
-                    penjelasan_key = f'penjelasan_{section_id}'
-                    code_content = request.form.get(code_key, '').strip()
-                    penjelasan_content = request.form.get(penjelasan_key, '').strip()
-                    code_content = clean_text(code_content)
-                    penjelasan_content = clean_text(penjelasan_content)
-                    if parent_key in request.form:
-                        main_sections[section_id]['parent_section'] = request.form[parent_key]
-                    if code_key in request.form:
-                        main_sections[section_id]['code'] = code_content
-                    if penjelasan_key in request.form:
-                        main_sections[section_id]['penjelasan'] = penjelasan_content
-                    main_sections[section_id]['image'] = request.form.get(f'image_{section_id}', '').strip()
+        dasar_teori_sections, main_sections = parse_form_sections(request.form)
 
         # Simpan metadata
         metadata = {
@@ -550,45 +818,12 @@ def index():
 
         # Simpan ke Supabase (PostgreSQL)
         try:
-            with db_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    INSERT INTO laporan (filename, metadata, tujuan, kesimpulan, referensi)
-                    VALUES (%s, %s, %s, %s, %s)
-                    ON CONFLICT (filename) DO UPDATE
-                    SET metadata = EXCLUDED.metadata,
-                        tujuan = EXCLUDED.tujuan,
-                        kesimpulan = EXCLUDED.kesimpulan,
-                        referensi = EXCLUDED.referensi
-                ''', (filename, json.dumps(metadata), tujuan, kesimpulan, referensi))
-
-                cursor.execute('DELETE FROM sections WHERE filename = %s', (filename,))
-
-                for section_id, section in dasar_teori_sections.items():
-                    cursor.execute('''
-                        INSERT INTO sections (filename, section_id, type, title, content, image)
-                        VALUES (%s, %s, %s, %s, %s, %s)
-                    ''', (filename, f"dasar_teori_{section_id}", 'dasar_teori', section['title'], section['content'], section['image']))
-
-                for section_id, section in main_sections.items():
-                    if section['type'] == 'section':
-                        cursor.execute('''
-                            INSERT INTO sections (filename, section_id, type, title)
-                            VALUES (%s, %s, %s, %s)
-                        ''', (filename, section_id, 'section', section['title']))
-                    else:
-                        cursor.execute('''
-                            INSERT INTO sections (filename, section_id, type, title, content, image, parent_section)
-                            VALUES (%s, %s, %s, %s, %s, %s, %s)
-                        ''', (filename, section_id, 'subsection', section['title'], section.get('code', ''), section.get('image', ''), section.get('parent_section', '')))
-                        cursor.execute('''
-                            INSERT INTO sections (filename, section_id, type, title, content, parent_section)
-                            VALUES (%s, %s, %s, %s, %s, %s)
-                        ''', (filename, f"penjelasan_{section_id}", 'penjelasan', section['title'], section.get('penjelasan', ''), section_id))
-
-                conn.commit()
+            sections = sections_from_form(dasar_teori_sections, main_sections)
+            changed, removed = save_report(filename, metadata, tujuan, kesimpulan, referensi, sections,
+                                           render_fragment=section_fragment, fragment_version=FRAGMENT_VERSION)
+            log.info("Saved %s: %d sections written, %d removed", filename, changed, removed)
         except Exception as e:
-            print(f"❌ Error saving to Supabase: {e}")
+            log.error("Error saving to Supabase: %s", e)
             flash(f'Error saving data to database: {str(e)}', 'error')
             return render_template('form.html', form_data=request.form, matkul_dosen=MATKUL_DOSEN, filenames=get_filenames())
 
@@ -597,28 +832,31 @@ def index():
             try:
                 old_folder_id = find_or_create_folder(original_filename)
                 new_folder_id = find_or_create_folder(filename)
-
-                query = f"'{old_folder_id}' in parents and trashed = false"
-                response = drive_client.files().list(
-                    q=query,
-                    spaces='drive',
-                    fields='files(id, name, mimeType)'
-                ).execute()
-                files = response.get('files', [])
-
-                for file in files:
-                    if file['mimeType'].startswith('image/') or 'lambang' in file['name'].lower():
-                        file_metadata = {
-                            'name': file['name'],
-                            'parents': [new_folder_id]
-                        }
-                        drive_client.files().copy(
-                            fileId=file['id'],
-                            body=file_metadata
-                        ).execute()
-                        print(f"Copied {file['name']} from {original_filename} to {filename}")
+                # Listing baru: gambar yang di-upload worker lain setelah manifest di-cache tidak boleh tertinggal
+                drive_manifest.refresh(old_folder_id)
+
+                to_copy = [
+                    (name, file_id, mime_type) for name, file_id, mime_type in drive_manifest.entries(old_folder_id)
+                    if (mime_type or '').startswith('image/') or name in asset_registry
+                ]
+                copy_requests = [
+                    get_drive_client().files().copy(
+                        fileId=file_id,
+                        body={'name': name, 'parents': [new_folder_id]},
+                        fields='id'
+                    )
+                    for name, file_id, _ in to_copy
+                ]
+                copied_count = 0
+                for (name, _, mime_type), (copied, error) in zip(to_copy, drive_batch.execute(copy_requests)):
+                    if error is not None:
+                        log.error("Error copying %s from %s to %s: %s", name, original_filename, filename, error)
+                        continue
+                    drive_manifest.remember(new_folder_id, name, copied['id'], mime_type)
+                    copied_count += 1
+                log.info("Copied %d/%d files from %s to %s", copied_count, len(to_copy), original_filename, filename)
             except Exception as e:
-                print(f"❌ Error copying files from {original_filename} to {filename}: {e}")
+                log.error("Error copying files from %s to %s: %s", original_filename, filename, e)
 
         session['last_filename'] = filename
         flash('Data tersimpan sukses!', 'success')
@@ -627,52 +865,12 @@ def index():
     last_filename = session.get('last_filename')
     if last_filename:
         try:
-            with db_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('SELECT * FROM laporan WHERE filename = %s', (last_filename,))
-                laporan = cursor.fetchone()
-                if not laporan:
-                    return render_template('form.html', form_data=None, matkul_dosen=MATKUL_DOSEN, filenames=get_filenames())
-
-                metadata = json.loads(laporan['metadata']) if laporan['metadata'] else {}
-                cursor.execute('SELECT * FROM sections WHERE filename = %s', (last_filename,))
-                sections = cursor.fetchall()
-                dasar_teori_sections = {}
-                main_sections = {}
-
-                for section in sections:
-                    if section['type'] == 'dasar_teori':
-                        section_id = section['section_id'].replace('dasar_teori_', '')
-                        dasar_teori_sections[section_id] = {
-                            'title': section['title'],
-                            'content': section['content'],
-                            'image': section['image']
-                        }
-                    elif section['type'] == 'section':
-                        main_sections[section['section_id']] = {
-                            'type': 'section',
-                            'title': section['title']
-                        }
-                    elif section['type'] == 'subsection':
-                        main_sections[section['section_id']] = {
-                            'type': 'subsection',
-                            'title': section['title'],
-                            'code': section['content'],
-                            'image': section['image'],
-                            'parent_section': section['parent_section']
-                        }
-                    elif section['type'] == 'penjelasan':
-                        section_id = section['parent_section']
-                        if section_id in main_sections:
-                            main_sections[section_id]['penjelasan'] = section['content']
-
-                metadata['dasar_teori_sections'] = dasar_teori_sections
-                metadata['main_sections'] = main_sections
-                metadata['tujuan'] = laporan['tujuan']
-                metadata['kesimpulan'] = laporan['kesimpulan']
-                metadata['referensi'] = laporan['referensi']
+            report = load_report(last_filename)
+            if not report:
+                return render_template('form.html', form_data=None, matkul_dosen=MATKUL_DOSEN, filenames=get_filenames())
+            metadata = report.to_form_data()
         except Exception as e:
-            print(f"❌ Error loading last filename from Supabase: {e}")
+            log.error("Error loading last filename from Supabase: %s", e)
             flash(f'Error loading last file: {str(e)}', 'error')
             return render_template('form.html', form_data=None, matkul_dosen=MATKUL_DOSEN, filenames=get_filenames())
 
@@ -683,286 +881,150 @@ def index():
 @app.route('/edit/<filename>')
 def edit(filename):
     try:
-        with db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM laporan WHERE filename = %s', (filename,))
-            laporan = cursor.fetchone()
-            if not laporan:
-                flash(f'File {filename} tidak ditemukan', 'error')
-                return redirect('/')
-
-            metadata = json.loads(laporan['metadata']) if laporan['metadata'] else {}
-            cursor.execute('SELECT * FROM sections WHERE filename = %s', (filename,))
-            sections = cursor.fetchall()
-            dasar_teori_sections = {}
-            main_sections = {}
-
-            for section in sections:
-                if section['type'] == 'dasar_teori':
-                    section_id = section['section_id'].replace('dasar_teori_', '')
-                    dasar_teori_sections[section_id] = {
-                        'title': section['title'],
-                        'content': section['content'],
-                        'image': section['image']
-                    }
-                elif section['type'] == 'section':
-                    main_sections[section['section_id']] = {
-                        'type': 'section',
-                        'title': section['title']
-                    }
-                elif section['type'] == 'subsection':
-                    main_sections[section['section_id']] = {
-                        'type': 'subsection',
-                        'title': section['title'],
-                        'code': section['content'],
-                        'image': section['image'],
-                        'parent_section': section['parent_section']
-                    }
-                elif section['type'] == 'penjelasan':
-                    section_id = section['parent_section']
-                    if section_id in main_sections:
-                        main_sections[section_id]['penjelasan'] = section['content']
-
-            metadata['dasar_teori_sections'] = dasar_teori_sections
-            metadata['main_sections'] = main_sections
-            metadata['tujuan'] = laporan['tujuan']
-            metadata['kesimpulan'] = laporan['kesimpulan']
-            metadata['referensi'] = laporan['referensi']
-
-        print(f"Loading edit form for {filename}")
-        print(f"Metadata keys: {list(metadata.keys())}")
+        report = load_report(filename)
+        if not report:
+            flash(f'File {filename} tidak ditemukan', 'error')
+            return redirect('/')
+        metadata = report.to_form_data()
+
+        log.info("Loading edit form for %s", filename)
 
         session['last_filename'] = filename
-        
-        print("Verification before sending to template:")
-        print(f"- Dasar teori sections: {len(metadata.get('dasar_teori_sections', {}))}")
-        for section_id, section in metadata.get('dasar_teori_sections', {}).items():
-            print(f"  - Section {section_id}: {section.get('title')}, content: {len(section.get('content', ''))} chars")
-            
-        print(f"- Main sections: {len(metadata.get('main_sections', {}))}")
-        for section_id, section in metadata.get('main_sections', {}).items():
-            if section.get('type') == 'section':
-                print(f"  - Section {section_id}: {section.get('title')}")
-            elif section.get('type') == 'subsection':
-                print(f"  - Subsection {section_id}: {section.get('title')}, code: {len(section.get('code', ''))} chars, penjelasan: {len(section.get('penjelasan', ''))} chars")
-        
+
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("Metadata keys: %s", list(metadata.keys()))
+            log.debug("Dasar teori sections: %d", len(metadata.get('dasar_teori_sections', {})))
+            for section_id, section in metadata.get('dasar_teori_sections', {}).items():
+                log.debug("  Section %s: %s, content: %d chars", section_id, section.get('title'), len(section.get('content', '')))
+            log.debug("Main sections: %d", len(metadata.get('main_sections', {})))
+            for section_id, section in metadata.get('main_sections', {}).items():
+                if section.get('type') == 'section':
+                    log.debug("  Section %s: %s", section_id, section.get('title'))
+                elif section.get('type') == 'subsection':
+                    log.debug("  Subsection %s: %s, code: %d chars, penjelasan: %d chars", section_id, section.get('title'),
+                              len(section.get('code', '')), len(section.get('penjelasan', '')))
+
         return render_template('form.html', form_data=metadata, matkul_dosen=MATKUL_DOSEN, filenames=get_filenames())
         
     except Exception as e:
-        import traceback
-        print(f"ERROR in edit route: {str(e)}")
-        traceback.print_exc()
+        log.exception("Error in edit route for %s", filename)
         flash(f'Error loading file {filename}: {str(e)}', 'error')
         return redirect('/')
 
+def iter_latex_document(metadata):
+    """Dokumen LaTeX lengkap sebagai potongan-potongan string, section demi section,
+    sehingga bisa dikirim bertahap tanpa membangun seluruh dokumen di memori"""
+    values = {
+        'MATKUL': metadata.get('matkul', ''),
+        'PERTEMUAN': metadata.get('pertemuan', ''),
+        'JUDUL': metadata.get('judul', ''),
+        'TANGGAL': metadata.get('tanggal', ''),
+        'NAMA': metadata.get('nama', ''),
+        'NPM': metadata.get('npm', ''),
+        'KELAS': metadata.get('kelas', ''),
+        'DOSEN': metadata.get('dosen', ''),
+        'TUJUAN': process_tujuan(metadata.get('tujuan', '')),
+        'DASAR_TEORI': iter_latex_for_dasar_teori(metadata.get('dasar_teori_sections', {})),
+        'HASIL_PEMBAHASAN': iter_latex_for_sections(metadata.get('main_sections', {})),
+        'KESIMPULAN': metadata.get('kesimpulan', ''),
+        'REFERENSI': process_referensi(metadata.get('referensi', ''))
+    }
+    return COMPILED_LATEX_TEMPLATE.iter_render(values)
+
+def rendered_tex(filename, report=None, metadata=None):
+    """(digest, path) file .tex laporan dari tex_store, dirender dan disimpan dulu jika belum ada
+    atau jika laporan sudah disimpan lagi sejak dirender (dicek dengan laporan.updated_at, jadi
+    simpan di instance lain juga terlihat). None jika laporan tidak ada."""
+    version = report.version if report is not None else report_version(filename)
+    if version is None:
+        return None
+    artifact = tex_store.get(filename, version)
+    if artifact:
+        return artifact
+    if report is None:
+        report = load_report(filename, with_fragments=True)
+        if not report:
+            return None
+    if metadata is None:
+        metadata = report.to_form_data()
+    with span('render', 'latex_document'):
+        return tex_store.put(filename, iter_latex_document(metadata), report.version)
+
+def read_tex(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+def report_image_paths(metadata):
+    """Daftar filepath gambar (folder/nama) yang dirujuk laporan, urut seperti di dokumen"""
+    images = []
+    for section in metadata.get('dasar_teori_sections', {}).values():
+        if section.get('image'):
+            images.append(section['image'])
+    for section in metadata.get('main_sections', {}).values():
+        if section.get('type') == 'subsection' and section.get('image'):
+            images.append(section['image'])
+    return images
+
 @app.route('/generate_latex/<filename>')
 def generate_latex(filename):
-    print(f"Generating LaTeX for {filename}")
+    log.info("Generating LaTeX for %s", filename)
     
     try:
-        with db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM laporan WHERE filename = %s', (filename,))
-            laporan = cursor.fetchone()
-            if not laporan:
-                flash(f'File {filename} tidak ditemukan', 'error')
-                return redirect('/')
-
-            metadata = json.loads(laporan['metadata']) if laporan['metadata'] else {}
-            cursor.execute('SELECT * FROM sections WHERE filename = %s', (filename,))
-            sections = cursor.fetchall()
-            dasar_teori_sections = {}
-            main_sections = {}
-
-            for section in sections:
-                if section['type'] == 'dasar_teori':
-                    section_id = section['section_id'].replace('dasar_teori_', '')
-                    dasar_teori_sections[section_id] = {
-                        'title': section['title'],
-                        'content': section['content'],
-                        'image': section['image']
-                    }
-                elif section['type'] == 'section':
-                    main_sections[section['section_id']] = {
-                        'type': 'section',
-                        'title': section['title']
-                    }
-                elif section['type'] == 'subsection':
-                    main_sections[section['section_id']] = {
-                        'type': 'subsection',
-                        'title': section['title'],
-                        'code': section['content'],
-                        'image': section['image'],
-                        'parent_section': section['parent_section']
-                    }
-                elif section['type'] == 'penjelasan':
-                    section_id = section['parent_section']
-                    if section_id in main_sections:
-                        main_sections[section_id]['penjelasan'] = section['content']
-
-            metadata['dasar_teori_sections'] = dasar_teori_sections
-            metadata['main_sections'] = main_sections
-            metadata['tujuan'] = laporan['tujuan']
-            metadata['kesimpulan'] = laporan['kesimpulan']
-            metadata['referensi'] = laporan['referensi']
-
-        project_folder_id = find_or_create_folder(filename)
-        logo_file_id = find_file_in_folder('lambang ugm.png', project_folder_id)
-        if not logo_file_id:
-            default_logo = os.path.join(app.static_folder, 'lambang ugm.png')
-            if os.path.exists(default_logo):
-                file_metadata = {
-                    'name': 'lambang ugm.png',
-                    'parents': [project_folder_id]
-                }
-                media = MediaFileUpload(default_logo, mimetype='image/png')
-                drive_client.files().create(
-                    body=file_metadata,
-                    media_body=media,
-                    fields='id'
-                ).execute()
-                print(f"Uploaded lambang ugm.png to Google Drive for {filename}")
-
-        latex_content = LATEX_TEMPLATE
-        
-        dasar_teori_latex = generate_latex_for_dasar_teori(dasar_teori_sections)
-        print(f"Generated dasar teori LaTeX: {len(dasar_teori_latex)} chars")
-        
-        hasil_pembahasan_latex = generate_latex_for_sections(main_sections)
-        print(f"Generated hasil pembahasan LaTeX: {len(hasil_pembahasan_latex)} chars")
-        
-        replacements = {
-            'MATKUL': metadata.get('matkul', ''),
-            'PERTEMUAN': metadata.get('pertemuan', ''),
-            'JUDUL': metadata.get('judul', ''),
-            'TANGGAL': metadata.get('tanggal', ''),
-            'NAMA': metadata.get('nama', ''),
-            'NPM': metadata.get('npm', ''),
-            'KELAS': metadata.get('kelas', ''),
-            'DOSEN': metadata.get('dosen', ''),
-            'TUJUAN': process_tujuan(metadata.get('tujuan', '')),
-            'DASAR_TEORI': dasar_teori_latex,
-            'HASIL_PEMBAHASAN': hasil_pembahasan_latex,
-            'KESIMPULAN': metadata.get('kesimpulan', ''),
-            'REFERENSI': process_referensi(metadata.get('referensi', ''))
-        }
-        
-        for key, value in replacements.items():
-            if value is None:
-                value = ''
-            latex_content = latex_content.replace(key, value)
-            print(f"Replaced {key} with {len(value)} chars")
-        
-        with tempfile.TemporaryDirectory() as temp_dir:
-            tex_file = os.path.join(temp_dir, f"{filename}.tex")
-            with open(tex_file, 'w', encoding='utf-8') as f:
-                f.write(latex_content)
-            print(f"Saved LaTeX content to {tex_file}")
-            
-            session['tex_file_path'] = tex_file
-        
-        images = []
-        for section in dasar_teori_sections.values():
-            if section.get('image'):
-                images.append({'name': os.path.basename(section['image'])})
-        for section in main_sections.values():
-            if section.get('type') == 'subsection' and section.get('image'):
-                images.append({'name': os.path.basename(section['image'])})
-        if logo_file_id:
-            images.append({'name': 'lambang ugm.png'})
-        
+        report = load_report(filename, with_fragments=True)
+        if not report:
+            flash(f'File {filename} tidak ditemukan', 'error')
+            return redirect('/')
+        metadata = report.to_form_data()
+        # Write-through: /latex dan /download_tex setelah ini cukup membaca file
+        rendered_tex(filename, report, metadata)
+
+        images = [{'name': os.path.basename(image)} for image in report_image_paths(metadata)]
+        images.extend({'name': asset.name} for asset in asset_registry.available(filename))
+
         return render_template('output.html', 
                               filename=filename,
                               form_data=metadata, 
-                              latex_content=latex_content,
-                              images=images,
-                              dasar_teori_length=len(dasar_teori_latex),
-                              hasil_pembahasan_length=len(hasil_pembahasan_latex))
+                              images=images)
                                
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        log.exception("Error generating LaTeX for %s", filename)
         flash(f'Error generating LaTeX: {str(e)}', 'error')
         return redirect(url_for('edit', filename=filename))
 
 @app.route('/download_image_zip/<filename>')
 def download_image_zip(filename):
     try:
-        with db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM laporan WHERE filename = %s', (filename,))
-            laporan = cursor.fetchone()
-            if not laporan:
-                flash(f'File {filename} tidak ditemukan', 'error')
-                return redirect(url_for('generate_latex', filename=filename))
-
-            metadata = json.loads(laporan['metadata']) if laporan['metadata'] else {}
-            cursor.execute('SELECT * FROM sections WHERE filename = %s', (filename,))
-            sections = cursor.fetchall()
-            dasar_teori_sections = {}
-            main_sections = {}
-
-            for section in sections:
-                if section['type'] == 'dasar_teori':
-                    section_id = section['section_id'].replace('dasar_teori_', '')
-                    dasar_teori_sections[section_id] = {
-                        'title': section['title'],
-                        'content': section['content'],
-                        'image': section['image']
-                    }
-                elif section['type'] == 'section':
-                    main_sections[section['section_id']] = {
-                        'type': 'section',
-                        'title': section['title']
-                    }
-                elif section['type'] == 'subsection':
-                    main_sections[section['section_id']] = {
-                        'type': 'subsection',
-                        'title': section['title'],
-                        'code': section['content'],
-                        'image': section['image'],
-                        'parent_section': section['parent_section']
-                    }
-
-            images = []
-            for section in dasar_teori_sections.values():
-                if section.get('image'):
-                    images.append(section['image'])
-            for section in main_sections.values():
-                if section.get('type') == 'subsection' and section.get('image'):
-                    images.append(section['image'])
-            project_folder_id = find_or_create_folder(filename)
-            logo_file_id = find_file_in_folder('lambang ugm.png', project_folder_id)
-            if logo_file_id:
-                images.append(f"{filename}/lambang ugm.png")
-
-        if not images:
+        report = load_report(filename)
+        if not report:
+            flash(f'File {filename} tidak ditemukan', 'error')
+            return redirect(url_for('generate_latex', filename=filename))
+
+        images = report_image_paths(report.to_form_data())
+        assets = asset_registry.available(filename)
+
+        if not images and not assets:
             flash('No images found to download', 'error')
             return redirect(url_for('generate_latex', filename=filename))
 
         memory_file = io.BytesIO()
+        manifest = []
         with ZipFile(memory_file, 'w') as zf:
-            for image_path in images:
-                parts = image_path.split('/')
-                if len(parts) < 2:
-                    continue
-                folder = '/'.join(parts[:-1])
-                image_name = parts[-1]
-
-                project_folder_id = find_or_create_folder(folder)
-                file_id = find_file_in_folder(image_name, project_folder_id)
-                if not file_id:
-                    continue
-
-                request = drive_client.files().get_media(fileId=file_id)
-                file_stream = io.BytesIO()
-                downloader = MediaIoBaseDownload(file_stream, request)
-                done = False
-                while not done:
-                    status, done = downloader.next_chunk()
-                file_stream.seek(0)
-
-                zf.writestr(image_name, file_stream.read())
+            for asset in assets:
+                zf.writestr(asset.name, asset.data)
+                manifest.append({'file': asset.name, 'source': asset_registry.filepath(asset.name), 'status': 'ok'})
+            for image_path, local_path, error in fetch_images_parallel(images):
+                image_name = image_path.split('/')[-1]
+                if not error:
+                    try:
+                        zf.write(local_path, arcname=image_name)
+                    except OSError as e:
+                        error = str(e)
+                if error:
+                    log.warning("Error adding %s to ZIP: %s", image_path, error)
+                    manifest.append({'file': image_name, 'source': image_path, 'status': 'failed', 'error': error})
+                else:
+                    manifest.append({'file': image_name, 'source': image_path, 'status': 'ok'})
+            zf.writestr('manifest.json', json.dumps({'filename': filename, 'files': manifest}, indent=2))
 
         memory_file.seek(0)
         return send_file(
@@ -972,23 +1034,216 @@ def download_image_zip(filename):
             download_name=f"{filename}_images.zip"
         )
     except Exception as e:
-        print(f"❌ Error downloading images as ZIP: {e}")
+        log.error("Error downloading images as ZIP: %s", e)
         flash('Error downloading images', 'error')
         return redirect(url_for('generate_latex', filename=filename))
 
+@app.route('/reports')
+def reports():
+    """Daftar laporan (JSON) dengan keyset pagination dan filter matkul/nama"""
+    limit = max(1, min(request.args.get('limit', 50, type=int), 200))
+    after = None
+    if 'after_filename' in request.args:
+        after = (request.args.get('after_tanggal', ''), request.args['after_filename'])
+    try:
+        items = list_reports(
+            limit=limit,
+            after=after,
+            matkul=request.args.get('matkul') or None,
+            nama=request.args.get('nama') or None
+        )
+    except Exception as e:
+        log.error("Error listing reports: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+    next_page = None
+    if len(items) == limit:
+        next_page = {'after_tanggal': items[-1]['tanggal'], 'after_filename': items[-1]['filename']}
+    return jsonify({'reports': items, 'next': next_page})
+
+@app.route('/download_bundle/<filename>')
+def download_bundle(filename):
+    """Satu ZIP berisi .tex, semua gambar yang dirujuk, dan aset template (lambang ugm.png), dikirim bertahap"""
+    try:
+        report = load_report(filename, with_fragments=True)
+        if not report:
+            flash(f'File {filename} tidak ditemukan', 'error')
+            return redirect('/')
+        metadata = report.to_form_data()
+
+        _, tex_path = rendered_tex(filename, report, metadata)
+        images = report_image_paths(metadata)
+        assets = asset_registry.available(filename)
+    except Exception as e:
+        log.error("Error preparing bundle for %s: %s", filename, e)
+        flash('Error preparing LaTeX bundle', 'error')
+        return redirect(url_for('generate_latex', filename=filename))
+
+    def generate():
+        archive = ZipStream()
+        yield from archive.add_file(f"{filename}.tex", tex_path, compress=True)
+        for asset in assets:
+            yield from archive.add_bytes(asset.name, asset.data, compress=False)
+
+        manifest = []
+        for image_path, local_path, error in fetch_images_parallel(images):
+            image_name = image_path.split('/')[-1]
+            if not error:
+                try:
+                    yield from archive.add_file(image_name, local_path)
+                except OSError as e:
+                    error = str(e)
+            if error:
+                log.warning("Error adding %s to bundle: %s", image_path, error)
+                manifest.append({'file': image_name, 'source': image_path, 'status': 'failed', 'error': error})
+            else:
+                manifest.append({'file': image_name, 'source': image_path, 'status': 'ok'})
+
+        yield from archive.add_bytes('manifest.json', json.dumps({'filename': filename, 'files': manifest}, indent=2).encode('utf-8'))
+        yield from archive.close()
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/zip',
+        headers={'Content-Disposition': f'attachment; filename="{filename}.zip"'}
+    )
+
+@app.route('/compile/<filename>')
+def compile_pdf(filename):
+    """Kompilasi laporan menjadi PDF di server; hasil di-cache berdasarkan isi .tex dan gambar"""
+    if not latex_compiler.available():
+        return jsonify({'success': False, 'error': f'LaTeX engine {latex_compiler.engine} is not available'}), 503
+
+    try:
+        report = load_report(filename, with_fragments=True)
+        if not report:
+            return jsonify({'success': False, 'error': f'File {filename} tidak ditemukan'}), 404
+        metadata = report.to_form_data()
+        latex_content = read_tex(rendered_tex(filename, report, metadata)[1])
+
+        image_paths = report_image_paths(metadata)
+        assets = asset_registry.available(filename)
+        images = [(asset.name, asset.path, asset.digest) for asset in assets]
+
+        loaded = {asset.name for asset in assets}
+        missing = [
+            {'source': asset_registry.filepath(name), 'error': 'template asset not available'}
+            for name in TEMPLATE_ASSETS if name not in loaded
+        ]
+        for image_path, local_path, error in fetch_images_parallel(image_paths):
+            if error:
+                missing.append({'source': image_path, 'error': error})
+            else:
+                # Objek cache gambar bernama sesuai hash isinya
+                images.append((image_path.split('/')[-1], local_path, os.path.basename(local_path)))
+        if missing:
+            return jsonify({'success': False, 'error': 'Some images could not be fetched', 'images': missing}), 502
+
+        key, future = latex_compiler.submit(latex_content, images)
+        # Beri waktu tunggu antrian selain timeout kompilasi itu sendiri
+        pdf_path = future.result(timeout=latex_compiler.timeout * 2)
+    except CompileError as e:
+        return jsonify({'success': False, 'error': str(e), 'log': e.log}), 422
+    except FuturesTimeoutError:
+        return jsonify({'success': False, 'error': 'Compile queue is busy, try again later'}), 503
+    except Exception as e:
+        log.error("Error compiling %s: %s", filename, e)
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+    return send_file(
+        pdf_path,
+        mimetype='application/pdf',
+        as_attachment=request.args.get('download') == '1',
+        download_name=f"{filename}.pdf",
+        etag=key,
+        conditional=True
+    )
+
+@app.route('/compile-stats')
+def compile_stats():
+    return jsonify(latex_compiler.stats())
+
+def send_tex(filename, as_attachment):
+    """Kirim .tex dari tex_store (sendfile + ETag), render sekali jika belum ada; None jika laporan tidak ada"""
+    artifact = rendered_tex(filename)
+    if artifact is None:
+        return None
+    digest, path = artifact
+    response = send_file(
+        path,
+        mimetype='application/x-tex' if as_attachment else 'text/plain',
+        as_attachment=as_attachment,
+        download_name=f"{filename}.tex",
+        etag=digest,
+        conditional=True
+    )
+    # Isi bisa berubah setelah laporan disimpan: browser selalu revalidasi dengan ETag
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 @app.route('/download_tex/<filename>')
 def download_tex(filename):
-    tex_file = session.get('tex_file_path')
-    if tex_file and os.path.exists(tex_file):
-        return send_file(tex_file, as_attachment=True, download_name=f"{filename}.tex")
-    flash('File LaTeX tidak ditemukan', 'error')
-    return redirect(url_for('edit', filename=filename))
+    response = send_tex(filename, as_attachment=True)
+    if response is None:
+        flash('File LaTeX tidak ditemukan', 'error')
+        return redirect(url_for('edit', filename=filename))
+    return response
+
+@app.route('/latex/<filename>')
+def latex_source(filename):
+    """Isi .tex mentah"""
+    response = send_tex(filename, as_attachment=False)
+    if response is None:
+        return jsonify({'error': f'File {filename} tidak ditemukan'}), 404
+    return response
+
+@app.route('/debug_tex_store')
+def debug_tex_store():
+    return jsonify(tex_store.stats())
+
+# Naikkan jika prompt atau post-processing di gemini_to_latex berubah supaya cache lama tidak dipakai
+CONVERSION_PROMPT_VERSION = '2'
+
+conversion_cache = ConversionCache(
+    get_conversion,
+    lambda key, latex_text: save_conversion(key, GEMINI_MODEL_NAME, latex_text),
+    max_entries=int(os.getenv('CONVERSION_CACHE_SIZE', '1024'))
+)
+CONVERSION_LOOKUPS = telemetry.REGISTRY.counter(
+    'laporan_conversion_cache_total', 'Konversi /convert-to-latex per sumber hasil', ('source',)
+)
+
+def conversion_key(text, preserve):
+    sha = hashlib.sha256(f"{CONVERSION_PROMPT_VERSION}\0{GEMINI_MODEL_NAME}\0{int(bool(preserve))}\0".encode('utf-8'))
+    sha.update(text.encode('utf-8'))
+    return sha.hexdigest()
+
+def conversion_prompt(text, preserve):
+    prompt = (f"Convert the following text to LaTeX format, but DO NOT include any LaTeX document "
+             f"preamble (no \\documentclass, \\usepackage, \\begin{{document}}, etc). "
+             f"Just provide the content LaTeX commands:\n\n{text}\n\n"
+             f"Ensure the output uses proper LaTeX syntax like \\section, \\textbf, \\item, etc. "
+             f"Do not add any document structure commands.")
+    if preserve:
+        prompt += "\nPreserve the original formatting as much as possible."
+    return prompt
+
+def gemini_to_latex(text, preserve):
+    """Konversi teks ke potongan LaTeX lewat Gemini, tanpa preamble/struktur dokumen"""
+    with span('gemini', 'generate_content'):
+        response = get_gemini_model().generate_content(conversion_prompt(text, preserve))
+    return sanitize_latex(response.text)
+
+def local_to_latex(text):
+    """Jalur cepat tanpa Gemini untuk teks sederhana; None jika teks perlu model"""
+    with span('convert', 'local'):
+        latex_text = convert_simple(text)
+    if latex_text is not None:
+        CONVERSION_LOOKUPS.inc(source='local')
+    return latex_text
 
 @app.route('/convert-to-latex', methods=['POST'])
 def convert_to_latex():
-    if not GEMINI_AVAILABLE or model is None:
-        return jsonify({'success': False, 'error': 'Gemini API is not available'}), 503
-
     data = request.get_json()
     text = data.get('text', '')
     preserve = data.get('preserve', True)
@@ -996,37 +1251,353 @@ def convert_to_latex():
     if not text:
         return jsonify({'success': False, 'error': 'Text is empty'}), 400
 
-    try:
-        prompt = (f"Convert the following text to LaTeX format, but DO NOT include any LaTeX document "
-                 f"preamble (no \\documentclass, \\usepackage, \\begin{{document}}, etc). "
-                 f"Just provide the content LaTeX commands:\n\n{text}\n\n"
-                 f"Ensure the output uses proper LaTeX syntax like \\section, \\textbf, \\item, etc. "
-                 f"Do not add any document structure commands.")
-        if preserve:
-            prompt += "\nPreserve the original formatting as much as possible."
-
-        response = model.generate_content(prompt)
-        latex_text = response.text.strip()
-
-        latex_text = re.sub(r'\\documentclass(\[.*?\])?\{.*?\}', '', latex_text)
-        latex_text = re.sub(r'\\usepackage(\[.*?\])?\{.*?\}', '', latex_text)
-        latex_text = re.sub(r'\\begin\{document\}', '', latex_text)
-        latex_text = re.sub(r'\\end\{document\}', '', latex_text)
-        
-        latex_text = re.sub(r'\n{3,}', '\n\n', latex_text)
-        latex_text = re.sub(r'(\\(?:begin|end)\{[^\}]*\})\n+', r'\1', latex_text)
-        latex_text = re.sub(r'\n\s*\\item', r'\\item', latex_text)
-        
-        latex_text = re.sub(r'%.*?\n', '\n', latex_text)
-        latex_text = latex_text.strip()
+    latex_text = local_to_latex(text)
+    if latex_text is not None:
+        return jsonify({'success': True, 'latex_text': latex_text, 'cached': False})
+
+    if get_gemini_model() is None:
+        return jsonify({'success': False, 'error': 'Gemini API is not available'}), 503
 
-        return jsonify({'success': True, 'latex_text': latex_text})
+    try:
+        # Teks yang sama (mis. setelah simpan/muat ulang atau double-click) tidak memanggil Gemini lagi
+        latex_text, source = conversion_cache.get(conversion_key(text, preserve), lambda: gemini_to_latex(text, preserve))
+        CONVERSION_LOOKUPS.inc(source=source)
+        return jsonify({'success': True, 'latex_text': latex_text, 'cached': source != 'computed'})
     except Exception as e:
-        import traceback
-        print("Error converting to LaTeX:")
-        traceback.print_exc()
+        log.exception("Error converting to LaTeX")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def cancel_gemini_stream(response):
+    """Hentikan stream Gemini di upstream (gRPC: cancel(), REST: tutup koneksi HTTP)"""
+    iterator = getattr(response, '_iterator', None)
+    for name in ('cancel', 'close'):
+        method = getattr(iterator, name, None)
+        if callable(method):
+            try:
+                method()
+            except Exception as e:
+                log.debug("Error cancelling Gemini stream: %s", e)
+            return
+    http_response = getattr(iterator, '_response', None)
+    if http_response is not None:
+        http_response.close()
+
+@app.route('/convert-to-latex/stream', methods=['POST'])
+def convert_to_latex_stream():
+    """Seperti /convert-to-latex, tapi hasil dikirim bertahap lewat Server-Sent Events.
+    Event: chunk {text} ditambahkan, reset {text} mengganti isi, done {latex_text, cached}, error {error}"""
+    data = request.get_json(silent=True) or {}
+    text = data.get('text', '')
+    preserve = data.get('preserve', True)
+    if not text:
+        return jsonify({'success': False, 'error': 'Text is empty'}), 400
+
+    local_latex = local_to_latex(text)
+    model = get_gemini_model() if local_latex is None else None
+    if local_latex is None and model is None:
+        return jsonify({'success': False, 'error': 'Gemini API is not available'}), 503
+
+    key = conversion_key(text, preserve)
+
+    def generate():
+        if local_latex is not None:
+            yield sse_event('done', {'latex_text': local_latex, 'cached': False})
+            return
+
+        # Permintaan identik yang sedang di-stream ditunggu, bukan dikirim lagi ke Gemini
+        try:
+            latex_text, source = conversion_cache.begin(key)
+        except Exception as e:
+            log.error("Error waiting for LaTeX conversion: %s", e)
+            yield sse_event('error', {'error': str(e) or type(e).__name__})
+            return
+        if latex_text is not None:
+            CONVERSION_LOOKUPS.inc(source=source)
+            yield sse_event('done', {'latex_text': latex_text, 'cached': True})
+            return
+
+        response = None
+        completed = False
+        error = None
+        try:
+            with span('gemini', 'generate_content_stream'):
+                response = model.generate_content(conversion_prompt(text, preserve), stream=True)
+                raw, sent = '', ''
+                for chunk in response:
+                    raw += chunk.text
+                    stable = stable_latex_prefix(raw)
+                    if stable == sent:
+                        continue
+                    if stable.startswith(sent):
+                        yield sse_event('chunk', {'text': stable[len(sent):]})
+                    else:
+                        yield sse_event('reset', {'text': stable})
+                    sent = stable
+            latex_text = sanitize_latex(raw)
+            completed = True
+        except Exception as e:
+            log.error("Error streaming LaTeX conversion: %s", e)
+            error = e
+        finally:
+            # Klien menutup koneksi (GeneratorExit) atau error: hentikan juga panggilan upstream
+            # dan lepaskan klaim agar pemanggil yang menunggu tidak tertahan
+            if not completed:
+                if response is not None:
+                    cancel_gemini_stream(response)
+                conversion_cache.abort(key, error)
+        if error is not None:
+            yield sse_event('error', {'error': str(error)})
+            return
+
+        conversion_cache.finish(key, latex_text)
+        CONVERSION_LOOKUPS.inc(source='computed')
+        yield sse_event('done', {'latex_text': latex_text, 'cached': False})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+# Batas satu prompt batch; keluaran LaTeX biasanya lebih panjang dari teks masukan,
+# jadi batas karakter masukan dijaga jauh di bawah batas token keluaran model
+GEMINI_BATCH_MAX_CHARS = int(os.getenv('GEMINI_BATCH_MAX_CHARS', '16000'))
+GEMINI_BATCH_MAX_ITEMS = int(os.getenv('GEMINI_BATCH_MAX_ITEMS', '20'))
+GEMINI_BATCH_TIMEOUT = float(os.getenv('GEMINI_BATCH_TIMEOUT', '120'))
+
+# Pool bersama untuk panggilan Gemini paralel, dibatasi GEMINI_CONCURRENCY
+gemini_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv('GEMINI_CONCURRENCY', '4')),
+    thread_name_prefix='gemini'
+)
+
+BATCH_BLOCK_PATTERN = re.compile(r'<<<BLOCK (\d+)>>>[ \t]*\n?(.*?)\n?[ \t]*<<<END \1>>>', re.DOTALL)
+
+def pack_batches(items):
+    """Kelompokkan (index, teks) ke batch sesuai GEMINI_BATCH_MAX_CHARS/_ITEMS, urutan dipertahankan"""
+    batches = []
+    current, size = [], 0
+    for index, text in items:
+        if current and (size + len(text) > GEMINI_BATCH_MAX_CHARS or len(current) >= GEMINI_BATCH_MAX_ITEMS):
+            batches.append(current)
+            current, size = [], 0
+        current.append((index, text))
+        size += len(text)
+    if current:
+        batches.append(current)
+    return batches
+
+def gemini_batch_to_latex(batch, preserve):
+    """Konversi beberapa teks dalam satu prompt. Mengembalikan {index: latex}; blok yang
+    hilang dari respons tidak ada di hasil dan dikonversi ulang satu per satu oleh pemanggil."""
+    if len(batch) == 1:
+        index, text = batch[0]
+        return {index: gemini_to_latex(text, preserve)}
+
+    blocks = "\n\n".join(f"<<<BLOCK {index}>>>\n{text}\n<<<END {index}>>>" for index, text in batch)
+    prompt = ("Convert each of the following text blocks to LaTeX format, but DO NOT include any LaTeX document "
+             "preamble (no \\documentclass, \\usepackage, \\begin{document}, etc). "
+             "Just provide the content LaTeX commands. "
+             "Ensure the output uses proper LaTeX syntax like \\section, \\textbf, \\item, etc. "
+             "Do not add any document structure commands.\n"
+             "Each block starts with a line <<<BLOCK n>>> and ends with a line <<<END n>>>. "
+             "Return every block in the same order wrapped in exactly the same marker lines, "
+             "convert each block independently and write nothing outside the markers.")
+    if preserve:
+        prompt += "\nPreserve the original formatting as much as possible."
+    prompt += f"\n\n{blocks}"
+
+    with span('gemini', 'generate_content_batch'):
+        response = get_gemini_model().generate_content(prompt)
+
+    expected = {index for index, _ in batch}
+    results = {}
+    for match in BATCH_BLOCK_PATTERN.finditer(response.text):
+        index = int(match.group(1))
+        if index in expected and index not in results:
+            results[index] = sanitize_latex(match.group(2))
+    return results
+
+@app.route('/convert-to-latex/batch', methods=['POST'])
+def convert_to_latex_batch():
+    """Konversi semua teks section sebuah laporan sekaligus.
+    Body: {"sections": {id: teks}, "preserve": bool}; hasil: {"results": {id: {...}}}"""
+    data = request.get_json(silent=True) or {}
+    sections = data.get('sections')
+    preserve = data.get('preserve', True)
+    if not isinstance(sections, dict) or not sections:
+        return jsonify({'success': False, 'error': 'No sections to convert'}), 400
+
+    results = {}
+    pending = {}  # conversion_key -> (teks, [id section])
+    for section_id, text in sections.items():
+        if not isinstance(text, str) or not text.strip():
+            results[section_id] = {'success': False, 'error': 'Text is empty'}
+            continue
+        latex_text = local_to_latex(text)
+        if latex_text is not None:
+            results[section_id] = {'success': True, 'latex_text': latex_text, 'cached': False}
+            continue
+        key = conversion_key(text, preserve)
+        latex_text, source = conversion_cache.lookup(key)
+        if latex_text is not None:
+            CONVERSION_LOOKUPS.inc(source=source)
+            results[section_id] = {'success': True, 'latex_text': latex_text, 'cached': True}
+        else:
+            pending.setdefault(key, (text, []))[1].append(section_id)
+
+    if pending and get_gemini_model() is None:
+        for text, section_ids in pending.values():
+            for section_id in section_ids:
+                results[section_id] = {'success': False, 'error': 'Gemini API is not available'}
+        return jsonify({'success': False, 'results': results}), 503
+
+    keys = list(pending)
+    items = [(index, pending[key][0]) for index, key in enumerate(keys)]
+    batches = pack_batches(items)
+    log.info("Batch conversion: %d sections, %d local/cached, %d prompts", len(sections), len(sections) - len(items), len(batches))
+
+    def convert_batch(batch):
+        converted = gemini_batch_to_latex(batch, preserve)
+        for index, latex_text in converted.items():
+            conversion_cache.put(keys[index], latex_text)
+        # Blok yang tidak kembali utuh dikonversi satu per satu (lewat cache + penggabungan request)
+        for index, text in batch:
+            if index not in converted:
+                converted[index], _ = conversion_cache.get(keys[index], lambda text=text: gemini_to_latex(text, preserve))
+        return converted
+
+    futures = [(batch, gemini_pool.submit(telemetry.bind(convert_batch), batch)) for batch in batches]
+    # GEMINI_BATCH_TIMEOUT berlaku untuk seluruh request, bukan per prompt
+    _, not_done = wait([future for _, future in futures], timeout=GEMINI_BATCH_TIMEOUT)
+    for batch, future in futures:
+        converted, error = {}, None
+        if future in not_done:
+            future.cancel()
+            error = f"timeout after {GEMINI_BATCH_TIMEOUT}s"
+        else:
+            try:
+                converted = future.result()
+            except Exception as e:
+                log.error("Error converting batch to LaTeX: %s", e)
+                error = str(e)
+
+        for index, _ in batch:
+            key = keys[index]
+            if index in converted:
+                CONVERSION_LOOKUPS.inc(source='computed')
+                result = {'success': True, 'latex_text': converted[index], 'cached': False}
+            else:
+                result = {'success': False, 'error': error or 'Conversion failed'}
+            for section_id in pending[key][1]:
+                results[section_id] = result
+
+    return jsonify({'success': all(result['success'] for result in results.values()), 'results': results})
+
+def encode_upload(raw_path, content_type, dest_path):
+    """Re-encode gambar upload ke PNG (maks 1200px), salin apa adanya jika gagal"""
+    if Image and content_type.startswith('image/'):
+        try:
+            with span('image', 'encode_png'), Image.open(raw_path) as img:
+                if img.mode == 'RGBA':
+                    img = img.convert('RGB')
+                max_size = 1200
+                if max(img.size) > max_size:
+                    ratio = max_size / max(img.size)
+                    img = img.resize((int(img.size[0] * ratio), int(img.size[1] * ratio)), Image.LANCZOS)
+                img.save(dest_path, 'PNG', optimize=True)
+            return
+        except Exception as e:
+            log.warning("Error processing image: %s", e)
+    shutil.copyfile(raw_path, dest_path)
+
+# Tinggi preview (px) untuk editor: 192 untuk layar biasa, 384 untuk layar 2x
+PREVIEW_SIZES = (192, 384)
+
+def preview_path(filepath, size):
+    """Filepath turunan preview WebP, mis. folder/img_x.png -> folder/img_x@192.webp"""
+    return f"{os.path.splitext(filepath)[0]}@{size}.webp"
+
+def make_preview(src_path, size, dest_path):
+    """Buat preview WebP dengan tinggi maksimum `size`"""
+    with span('image', 'preview_webp'), Image.open(src_path) as img:
+        img.thumbnail((size * 4, size), Image.LANCZOS)
+        if img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGBA')
+        img.save(dest_path, 'WEBP', quality=80, method=4)
+
+def upload_to_drive(folder, name, path, mimetype):
+    """Upload file lokal ke folder Drive, menimpa file dengan nama sama jika ada"""
+    project_folder_id = find_or_create_folder(folder)
+    file_id = find_file_in_folder(name, project_folder_id)
+    media = MediaFileUpload(path, mimetype=mimetype)
+    if file_id:
+        get_drive_client().files().update(
+            fileId=file_id,
+            media_body=media
+        ).execute()
+    else:
+        file_metadata = {
+            'name': name,
+            'parents': [project_folder_id]
+        }
+        created = get_drive_client().files().create(
+            body=file_metadata,
+            media_body=media,
+            fields='id'
+        ).execute()
+        drive_manifest.remember(project_folder_id, name, created['id'], mimetype)
+
+def process_upload(filepath, job):
+    """Job antrian upload: encode gambar dan preview-nya, simpan ke cache lokal, lalu upload ke Google Drive"""
+    if not job.get('encoded_path'):
+        tmp = image_cache.temp_file()
+        tmp.close()
+        encode_upload(job['raw_path'], job['content_type'], tmp.name)
+        image_cache.put_file(filepath, tmp.name)
+        job['encoded_path'] = tmp.name
+
+    if job.get('previews') is None:
+        job['previews'] = []
+        if Image:
+            for size in PREVIEW_SIZES:
+                tmp = image_cache.temp_file()
+                tmp.close()
+                try:
+                    make_preview(job['encoded_path'], size, tmp.name)
+                except Exception as e:
+                    os.remove(tmp.name)
+                    log.warning("Error creating %dpx preview for %s: %s", size, filepath, e)
+                    continue
+                image_cache.put_file(preview_path(filepath, size), tmp.name)
+                job['previews'].append((os.path.basename(preview_path(filepath, size)), tmp.name))
+
+    upload_to_drive(job['folder'], job['filename'], job['encoded_path'], 'image/png')
+    for name, path in job['previews']:
+        upload_to_drive(job['folder'], name, path, 'image/webp')
+
+def cleanup_upload(filepath, job):
+    paths = [job.get('raw_path'), job.get('encoded_path')] + [path for _, path in job.get('previews') or []]
+    for path in paths:
+        if path and os.path.exists(path):
+            os.remove(path)
+            log.debug("Deleted temporary file %s", path)
+
+# Di Vercel fungsi dibekukan setelah response dikirim, jadi upload di background bisa macet atau
+# hilang; di sana upload dijalankan langsung di request (UPLOAD_ASYNC=1 memaksa background)
+UPLOAD_ASYNC = os.getenv('UPLOAD_ASYNC') or ('0' if os.getenv('VERCEL') else '1')
+
+upload_queue = UploadQueue(
+    process_upload,
+    cleanup=cleanup_upload,
+    workers=int(os.getenv('UPLOAD_WORKERS', '4')),
+    max_attempts=int(os.getenv('UPLOAD_MAX_ATTEMPTS', '3')),
+    run_async=UPLOAD_ASYNC != '0'
+)
+
 @app.route('/upload', methods=['POST'])
 def upload_file():
     if 'image' not in request.files:
@@ -1044,70 +1615,193 @@ def upload_file():
     timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
     rand_suffix = uuid.uuid4().hex[:6]
     filename = secure_filename(f"img_{timestamp}_{rand_suffix}.png")
+    file_path = f"{folder}/{filename}"
 
-    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.png')
-    temp_file_path = temp_file.name
+    # Simpan file mentah saja; encode dan upload ke Drive dikerjakan antrian latar belakang
+    raw_file = image_cache.temp_file()
+    try:
+        with raw_file:
+            file.save(raw_file)
+    except Exception as e:
+        os.remove(raw_file.name)
+        log.error("Error saving upload %s: %s", file_path, e)
+        return jsonify({'error': str(e)}), 500
+
+    job = upload_queue.submit(file_path, {
+        'raw_path': raw_file.name,
+        'content_type': file.content_type or '',
+        'folder': folder,
+        'filename': filename,
+        'encoded_path': None
+    })
+    if job['status'] == 'failed':
+        return jsonify({'error': job['error']}), 500
+
+    return jsonify({
+        'success': True,
+        'filename': filename,
+        'filepath': file_path,
+        'status': job['status'],
+        'status_url': url_for('upload_status', filepath=file_path)
+    })
+
+@app.route('/upload-status/<path:filepath>')
+def upload_status(filepath):
+    job = upload_queue.status(filepath)
+    if job:
+        return jsonify(job)
+    # Job tidak dikenal di worker ini (atau sudah lama selesai): cek langsung ke Drive
+    try:
+        parts = filepath.split('/')
+        if len(parts) >= 2:
+            project_folder_id = find_or_create_folder('/'.join(parts[:-1]))
+            if find_file_in_folder(parts[-1], project_folder_id):
+                return jsonify({'status': 'done', 'attempts': None, 'error': None})
+    except Exception as e:
+        log.error("Error checking upload status for %s: %s", filepath, e)
+    return jsonify({'status': 'unknown', 'attempts': None, 'error': None}), 404
+
+def download_drive_file(file_id, file_stream):
+    """Download isi file Drive ke file object"""
+    media_request = get_drive_client().files().get_media(fileId=file_id)
+    downloader = MediaIoBaseDownload(file_stream, media_request)
+    done = False
+    while not done:
+        with span('drive', 'drive.files.get_media'):
+            status, done = downloader.next_chunk()
 
+def fetch_image_to_cache(filepath):
+    """Pastikan gambar `folder/nama` ada di cache lokal, download dari Drive jika belum.
+    Mengembalikan (digest, path) atau None jika gambar tidak ada di Drive."""
+    cached = image_cache.get(filepath)
+    if cached:
+        return cached
+
+    parts = filepath.split('/')
+    folder = '/'.join(parts[:-1])
+    filename = parts[-1]
+    # Jalur baca: folder yang belum ada berarti gambarnya juga belum ada, jangan dibuat
+    project_folder_id = find_folder(folder)
+    file_id = find_file_in_folder(filename, project_folder_id) if project_folder_id else None
+    if not file_id:
+        return None
+
+    tmp = image_cache.temp_file()
     try:
-        if Image and file.content_type.startswith('image/'):
-            try:
-                img = Image.open(file)
-                if img.mode == 'RGBA':
-                    img = img.convert('RGB')
-                max_size = 1200
-                if max(img.size) > max_size:
-                    ratio = max_size / max(img.size)
-                    img = img.resize((int(img.size[0] * ratio), int(img.size[1] * ratio)), Image.LANCZOS)
-                img.save(temp_file_path, 'PNG', optimize=True)
-                print(f"Image temporarily saved to {temp_file_path}")
-            except Exception as e:
-                print(f"Error processing image: {e}")
-                file.save(temp_file_path)
+        with tmp:
+            download_drive_file(file_id, tmp)
+        return image_cache.put_file(filepath, tmp.name, move=True)
+    finally:
+        if os.path.exists(tmp.name):
+            os.remove(tmp.name)
+
+def fetch_images_parallel(image_paths):
+    """Ambil banyak gambar ke cache lokal secara paralel.
+    Menghasilkan (filepath, path_lokal, error) dengan urutan sama seperti input.
+    DRIVE_FETCH_TIMEOUT berlaku untuk seluruh batch, bukan per gambar."""
+    jobs = []
+    for image_path in dict.fromkeys(image_paths):
+        if len(image_path.split('/')) < 2:
+            jobs.append((image_path, None))
         else:
-            file.save(temp_file_path)
-
-        temp_file.close()
+            jobs.append((image_path, drive_fetch_pool.submit(telemetry.bind(fetch_image_to_cache), image_path)))
 
+    deadline = time.monotonic() + app.config['DRIVE_FETCH_TIMEOUT']
+    for index, (image_path, future) in enumerate(jobs):
+        if future is None:
+            yield image_path, None, 'invalid filepath format'
+            continue
         try:
-            project_folder_id = find_or_create_folder(folder)
-            file_id = find_file_in_folder(filename, project_folder_id)
-
-            if file_id:
-                media = MediaFileUpload(temp_file_path, mimetype='image/png')
-                drive_client.files().update(
-                    fileId=file_id,
-                    media_body=media
-                ).execute()
-            else:
-                file_metadata = {
-                    'name': filename,
-                    'parents': [project_folder_id]
-                }
-                media = MediaFileUpload(temp_file_path, mimetype='image/png')
-                drive_client.files().create(
-                    body=file_metadata,
-                    media_body=media,
-                    fields='id'
-                ).execute()
-
-            file_path = f"{folder}/{filename}"
-            return jsonify({
-                'success': True,
-                'filename': filename,
-                'filepath': file_path
-            })
+            cached = future.result(timeout=max(deadline - time.monotonic(), 0))
+        except (FuturesTimeoutError, CancelledError):
+            # Batas waktu habis: batalkan semua yang belum mulai, yang sudah selesai tetap dipakai
+            for _, pending in jobs[index:]:
+                if pending is not None:
+                    pending.cancel()
+            yield image_path, None, f"timeout after {app.config['DRIVE_FETCH_TIMEOUT']}s"
+            continue
         except Exception as e:
-            print(f"❌ Error uploading image to Google Drive: {e}")
-            return jsonify({'error': str(e)}), 500
+            yield image_path, None, str(e)
+            continue
+        if cached:
+            yield image_path, cached[1], None
+        else:
+            yield image_path, None, 'not found in Google Drive'
+
+# Preview yang sedang dibuat per key; request lain untuk preview yang sama menunggu hasilnya
+_preview_builds = {}
+_preview_build_lock = threading.Lock()
+
+def fetch_preview_to_cache(filepath, size, remote=True):
+    """Ambil preview WebP dari cache/Drive, atau buat dari gambar asli jika belum ada.
+    Dengan remote=False (aset template) Drive tidak disentuh sama sekali."""
+    key = preview_path(filepath, size)
+    cached = fetch_image_to_cache(key) if remote else image_cache.get(key)
+    if cached:
+        return cached
+
+    with _preview_build_lock:
+        future = _preview_builds.get(key)
+        owner = future is None
+        if owner:
+            future = _preview_builds[key] = Future()
+    if not owner:
+        return future.result(timeout=app.config['DRIVE_FETCH_TIMEOUT'])
+
+    try:
+        # Cek ulang: pembuat sebelumnya bisa saja selesai di antara cek pertama dan lock
+        cached = image_cache.get(key) or build_preview(filepath, size, key, remote)
+        future.set_result(cached)
+        return cached
+    except BaseException as e:
+        future.set_exception(e)
+        raise
     finally:
-        import time
-        time.sleep(0.1)
-        try:
-            if os.path.exists(temp_file_path):
-                os.remove(temp_file_path)
-                print(f"Deleted temporary file {temp_file_path}")
-        except Exception as e:
-            print(f"❌ Error deleting temporary file {temp_file_path}: {e}")
+        with _preview_build_lock:
+            _preview_builds.pop(key, None)
+
+def build_preview(filepath, size, key, remote):
+    """Buat preview `key` dari gambar asli `filepath`; None jika gambar asli tidak ada"""
+    original = fetch_image_to_cache(filepath) if remote else image_cache.get(filepath)
+    if not original:
+        return None
+    tmp = image_cache.temp_file()
+    tmp.close()
+    try:
+        make_preview(original[1], size, tmp.name)
+        if not remote:
+            return image_cache.put_file(key, tmp.name, move=True)
+        cached = image_cache.put_file(key, tmp.name)
+        # Simpan juga di Drive supaya cache lokal yang dingin tidak perlu download gambar asli
+        drive_fetch_pool.submit(store_preview_in_drive, key, tmp.name)
+        return cached
+    except Exception:
+        if os.path.exists(tmp.name):
+            os.remove(tmp.name)
+        raise
+
+def store_preview_in_drive(key, path):
+    try:
+        parts = key.split('/')
+        folder, name = '/'.join(parts[:-1]), parts[-1]
+        # Listing segar sebelum upload: instance lain bisa sudah mengupload preview yang sama,
+        # dan manifest lokal (termasuk cache negatifnya) belum tentu melihatnya
+        project_folder_id = find_folder(folder)
+        if project_folder_id and name in drive_manifest.refresh(project_folder_id):
+            return
+        upload_to_drive(folder, name, path, 'image/webp')
+    except Exception as e:
+        log.error("Error uploading preview %s to Google Drive: %s", key, e)
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+def image_not_modified(digest):
+    response = make_response('', 304)
+    response.set_etag(digest)
+    response.cache_control.public = True
+    response.cache_control.max_age = app.config['IMAGE_CACHE_MAX_AGE']
+    return response
 
 @app.route('/get-image/<path:filepath>')
 def get_image(filepath):
@@ -1115,29 +1809,52 @@ def get_image(filepath):
         parts = filepath.split('/')
         if len(parts) < 2:
             return "Invalid filepath format", 400
-        folder = '/'.join(parts[:-1])
-        filename = parts[-1]
 
-        project_folder_id = find_or_create_folder(folder)
-        file_id = find_file_in_folder(filename, project_folder_id)
-        if not file_id:
+        # Aset template dilayani dari salinan bersama (sudah ada di cache lokal), bukan dari folder laporan
+        is_asset = parts[-1] in asset_registry
+        if is_asset:
+            if not asset_registry.get(parts[-1], '/'.join(parts[:-1])):
+                return "Image not found", 404
+            filepath = asset_registry.filepath(parts[-1])
+
+        # ?size=192|384 mengembalikan preview WebP, bukan gambar asli
+        size = request.args.get('size', type=int)
+        if size and size not in PREVIEW_SIZES:
+            return "Invalid preview size", 400
+        if size and not Image:
+            size = None
+        key = preview_path(filepath, size) if size else filepath
+        mimetype = 'image/webp' if size else 'image/png'
+
+        # Hash isi sudah diketahui: jawab 304 tanpa menyentuh Drive
+        digest = image_cache.etag_for(key)
+        if digest and request.if_none_match.contains(digest):
+            return image_not_modified(digest)
+
+        cached = image_cache.get(key)
+        if not cached:
+            # Upload masih di antrian: kirim salinan lokal yang belum di-encode tanpa cache
+            pending = upload_queue.payload(filepath)
+            if pending and os.path.exists(pending['raw_path']):
+                return send_file(pending['raw_path'], mimetype=pending['content_type'] or 'image/png', max_age=0)
+            if is_asset:
+                cached = fetch_preview_to_cache(filepath, size, remote=False) if size else image_cache.get(filepath)
+            else:
+                cached = fetch_preview_to_cache(filepath, size) if size else fetch_image_to_cache(filepath)
+        if not cached:
             return "Image not found", 404
-
-        request = drive_client.files().get_media(fileId=file_id)
-        file_stream = io.BytesIO()
-        downloader = MediaIoBaseDownload(file_stream, request)
-        done = False
-        while not done:
-            status, done = downloader.next_chunk()
-        file_stream.seek(0)
+        digest, path = cached
 
         return send_file(
-            file_stream,
-            mimetype='image/png',
-            as_attachment=False
+            path,
+            mimetype=mimetype,
+            as_attachment=False,
+            etag=digest,
+            max_age=app.config['IMAGE_CACHE_MAX_AGE'],
+            conditional=True
         )
     except Exception as e:
-        print(f"❌ Error retrieving image from Google Drive: {e}")
+        log.error("Error retrieving image from Google Drive: %s", e)
         return "Image not found", 404
 
 @app.errorhandler(404)
@@ -1145,11 +1862,11 @@ def not_found(e):
     path = request.path
     
     if any(path.endswith(f'.{ext}') for ext in ALLOWED_EXTENSIONS):
-        print(f"404 Error: Image not found at {path}")
+        log.warning("404 Error: Image not found at %s", path)
         if path.startswith('/static/uploads/') and '/' in path[15:]:
             filename = path.split('/')[-1]
             if os.path.exists(os.path.join(app.static_folder, 'uploads', filename)):
-                print(f"Found image at root uploads folder: {filename}")
+                log.info("Found image at root uploads folder: %s", filename)
                 return redirect(url_for('get_image', filename=filename))
     
     return "File not found", 404
@@ -1159,53 +1876,50 @@ ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'svg', 'pdf', 'webp', 'bmp'}
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+@app.route('/metrics')
+def metrics():
+    """Metrik dalam format teks Prometheus"""
+    return Response(telemetry.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@app.cli.command('upload-assets')
+@click.option('--from-report', 'report', default=None, help='ambil aset dari folder laporan ini jika tidak ada di static/')
+def upload_assets_command(report):
+    """Upload aset template ke folder Drive bersama (sekali setelah deploy pertama atau perubahan aset)"""
+    for name, mimetype in TEMPLATE_ASSETS.items():
+        local = asset_registry.local_path(name)
+        if not os.path.exists(local):
+            cached = fetch_image_to_cache(f"{report}/{name}") if report else None
+            if not cached:
+                log.warning("Template asset %s not found in %s%s, skipped", name, asset_registry.local_dir,
+                            f" or {report}" if report else '')
+                continue
+            local = cached[1]
+        upload_to_drive(asset_registry.folder, name, local, mimetype)
+        log.info("Uploaded template asset %s to %s", name, asset_registry.filepath(name))
+
+@app.route('/debug_assets')
+def debug_assets():
+    return jsonify(asset_registry.stats())
+
+@app.route('/debug_drive_cache')
+def debug_drive_cache():
+    return jsonify(dict(drive_manifest.stats(), batch=drive_batch.stats()))
+
+@app.route('/debug_conversion_cache')
+def debug_conversion_cache():
+    return jsonify(conversion_cache.stats())
+
+@app.route('/debug_db_pool')
+def debug_db_pool():
+    return jsonify(get_pool().stats())
+
 @app.route('/debug_latex_content/<filename>')
 def debug_latex_content(filename):
     try:
-        with db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM laporan WHERE filename = %s', (filename,))
-            laporan = cursor.fetchone()
-            if not laporan:
-                return f"Metadata not found for {filename}", 404
-
-            metadata = json.loads(laporan['metadata']) if laporan['metadata'] else {}
-            cursor.execute('SELECT * FROM sections WHERE filename = %s', (filename,))
-            sections = cursor.fetchall()
-            dasar_teori_sections = {}
-            main_sections = {}
-
-            for section in sections:
-                if section['type'] == 'dasar_teori':
-                    section_id = section['section_id'].replace('dasar_teori_', '')
-                    dasar_teori_sections[section_id] = {
-                        'title': section['title'],
-                        'content': section['content'],
-                        'image': section['image']
-                    }
-                elif section['type'] == 'section':
-                    main_sections[section['section_id']] = {
-                        'type': 'section',
-                        'title': section['title']
-                    }
-                elif section['type'] == 'subsection':
-                    main_sections[section['section_id']] = {
-                        'type': 'subsection',
-                        'title': section['title'],
-                        'code': section['content'],
-                        'image': section['image'],
-                        'parent_section': section['parent_section']
-                    }
-                elif section['type'] == 'penjelasan':
-                    section_id = section['parent_section']
-                    if section_id in main_sections:
-                        main_sections[section_id]['penjelasan'] = section['content']
-
-            metadata['dasar_teori_sections'] = dasar_teori_sections
-            metadata['main_sections'] = main_sections
-            metadata['tujuan'] = laporan['tujuan']
-            metadata['kesimpulan'] = laporan['kesimpulan']
-            metadata['referensi'] = laporan['referensi']
+        report = load_report(filename)
+        if not report:
+            return f"Metadata not found for {filename}", 404
+        dasar_teori_sections, main_sections = report.split_sections()
 
         output = []
         output.append(f"<h1>LaTeX Debug for {filename}</h1>")
@@ -1257,6 +1971,8 @@ def debug_latex_content(filename):
         return error_html
 
 if __name__ == '__main__':
+    # Server development lokal: pastikan skema ada sebelum menerima request
+    init_db()
     app.run(debug=True)
 
 application = app
\ No newline at end of file
@@ -0,0 +1,130 @@
+import hashlib
+import os
+import tempfile
+import threading
+
+
+class RenderedArtifactStore:
+    """File hasil render (mis. .tex) per laporan di disk, content-addressed (sha256).
+
+    `objects/<sha256><suffix>` menyimpan isi, `refs/<sha1(filename)>` menyimpan hash isi terakhir
+    beserta versi data sumber yang dirender (mis. laporan.updated_at). Ref hanya dipakai jika
+    versinya sama dengan versi yang dibaca pemanggil dari database, jadi instance yang tidak
+    menangani simpan tetap melihat perubahan dan hasil render lama tidak pernah dilayani.
+    """
+
+    CHUNK_ENCODING = 'utf-8'
+
+    def __init__(self, root, suffix='.tex', max_objects=500):
+        self.root = root
+        self.suffix = suffix
+        self.max_objects = max_objects
+        self.objects_dir = os.path.join(root, 'objects')
+        self.refs_dir = os.path.join(root, 'refs')
+        self._lock = threading.Lock()
+        self._ready = False
+        self.hits = 0
+        self.misses = 0
+        self.outdated = 0
+        self.writes = 0
+
+    def _ensure_dirs(self):
+        """Buat direktori saat pertama ditulis, bukan saat import"""
+        if not self._ready:
+            os.makedirs(self.objects_dir, exist_ok=True)
+            os.makedirs(self.refs_dir, exist_ok=True)
+            self._ready = True
+
+    def _ref_path(self, filename):
+        return os.path.join(self.refs_dir, hashlib.sha1(filename.encode('utf-8')).hexdigest())
+
+    def object_path(self, digest):
+        return os.path.join(self.objects_dir, f"{digest}{self.suffix}")
+
+    def get(self, filename, version):
+        """(digest, path) hasil render `filename` untuk `version`, None jika belum ada atau versinya lain"""
+        try:
+            with open(self._ref_path(filename), 'r', encoding='utf-8') as f:
+                digest, _, stored_version = f.read().partition('\n')
+        except OSError:
+            digest = stored_version = ''
+        if digest and stored_version != version:
+            with self._lock:
+                self.outdated += 1
+            digest = ''
+        if digest:
+            path = self.object_path(digest)
+            try:
+                # mtime dipakai sebagai penanda LRU
+                os.utime(path, None)
+                with self._lock:
+                    self.hits += 1
+                return digest, path
+            except OSError:
+                pass
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, filename, chunks, version):
+        """Tulis potongan string `chunks` dan jadikan hasil render `filename` untuk `version`"""
+        self._ensure_dirs()
+        sha = hashlib.sha256()
+        tmp = tempfile.NamedTemporaryFile(dir=self.root, prefix='tmp_', delete=False)
+        try:
+            with tmp:
+                for chunk in chunks:
+                    data = chunk.encode(self.CHUNK_ENCODING)
+                    sha.update(data)
+                    tmp.write(data)
+            digest = sha.hexdigest()
+            path = self.object_path(digest)
+            if os.path.exists(path):
+                os.remove(tmp.name)
+                os.utime(path, None)
+            else:
+                os.replace(tmp.name, path)
+        except BaseException:
+            try:
+                os.remove(tmp.name)
+            except OSError:
+                pass
+            raise
+
+        # Render yang membaca versi lama bisa menimpa ref versi baru; get() berikutnya dengan
+        # versi baru hanya akan render ulang, tidak pernah melayani isi lama
+        ref_path = self._ref_path(filename)
+        ref_tmp = f"{ref_path}.{os.getpid()}.{threading.get_ident()}"
+        with open(ref_tmp, 'w', encoding='utf-8') as f:
+            f.write(f"{digest}\n{version}")
+        os.replace(ref_tmp, ref_path)
+        with self._lock:
+            self.writes += 1
+        self._evict(keep=digest)
+        return digest, path
+
+    def _evict(self, keep=None):
+        entries = sorted(
+            (entry for entry in os.scandir(self.objects_dir) if entry.name.endswith(self.suffix)),
+            key=lambda entry: entry.stat().st_mtime,
+            reverse=True
+        )
+        for entry in entries[self.max_objects:]:
+            if entry.name == f"{keep}{self.suffix}":
+                continue
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+    def stats(self):
+        self._ensure_dirs()
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'outdated': self.outdated,
+                'writes': self.writes,
+                'objects': sum(1 for name in os.listdir(self.objects_dir) if name.endswith(self.suffix)),
+                'max_objects': self.max_objects,
+            }
@@ -0,0 +1,131 @@
+import os
+import threading
+import time
+
+
+class TemplateAsset:
+    """Satu aset template beserta isinya di memori"""
+    __slots__ = ('name', 'digest', 'data', 'path', 'mimetype')
+
+    def __init__(self, name, digest, data, path, mimetype):
+        self.name = name
+        self.digest = digest
+        self.data = data
+        self.path = path
+        self.mimetype = mimetype
+
+
+class AssetRegistry:
+    """Aset template yang sama untuk semua laporan (mis. lambang ugm.png di halaman sampul).
+
+    Sumbernya berurutan: file di `local_dir` (ikut deploy), cache gambar lokal yang
+    content-addressed, salinan bersama di folder Drive `folder`, lalu salinan lama di folder
+    laporan itu sendiri (`<laporan>/<nama>`). Salinan dari folder laporan dicatat di cache lokal
+    dengan key bersama, jadi laporan lain tidak perlu ke Drive lagi. Setelah dimuat, isi aset
+    dilayani dari memori sehingga render/ZIP laporan tidak memanggil Drive untuk aset template.
+    `fetch(filepath)` hanya membaca dari Drive, tidak pernah membuat folder.
+    """
+
+    def __init__(self, assets, folder, local_dir, image_cache, fetch, negative_ttl=3600):
+        self.assets = dict(assets)  # nama -> mimetype
+        self.folder = folder
+        self.local_dir = local_dir
+        self._image_cache = image_cache
+        self._fetch = fetch
+        self.negative_ttl = negative_ttl
+        self._loaded = {}
+        self._missing = {}  # nama -> waktu terakhir salinan bersama tidak ditemukan
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.loads = 0
+        self.report_fallbacks = 0
+
+    def __contains__(self, name):
+        return name in self.assets
+
+    def filepath(self, name):
+        """Filepath Drive (folder/nama) salinan bersama aset"""
+        return f"{self.folder}/{name}"
+
+    def local_path(self, name):
+        return os.path.join(self.local_dir, name)
+
+    def get(self, name, report=None):
+        """TemplateAsset untuk `name`, atau None jika aset tidak tersedia di mana pun.
+        Dengan `report` (nama folder laporan), salinan di folder laporan dipakai sebagai fallback."""
+        if name not in self.assets:
+            return None
+        with self._lock:
+            asset = self._loaded.get(name)
+            missing_at = self._missing.get(name)
+        if asset is not None:
+            self._ensure_file(asset)
+            with self._lock:
+                self.hits += 1
+            return asset
+
+        shared_missing = missing_at is not None and time.monotonic() - missing_at < self.negative_ttl
+        if not shared_missing:
+            asset = self._load(name)
+            if asset is None:
+                with self._lock:
+                    self._missing[name] = time.monotonic()
+        if asset is None and report:
+            asset = self._load_from_report(name, report)
+        if asset is not None:
+            with self._lock:
+                self._missing.pop(name, None)
+                self._loaded[name] = asset
+                self.loads += 1
+        return asset
+
+    def available(self, report=None):
+        """Aset yang tersedia, urut sesuai pendaftaran"""
+        return [asset for asset in (self.get(name, report) for name in self.assets) if asset is not None]
+
+    def _load(self, name):
+        filepath = self.filepath(name)
+        local = self.local_path(name)
+        if os.path.exists(local):
+            cached = self._image_cache.put_file(filepath, local)
+        else:
+            cached = self._image_cache.get(filepath) or self._fetch(filepath)
+        if not cached:
+            return None
+        return self._read(name, cached)
+
+    def _load_from_report(self, name, report):
+        """Salinan aset di folder laporan (laporan yang dibuat sebelum ada salinan bersama)"""
+        cached = self._fetch(f"{report}/{name}")
+        if not cached:
+            return None
+        # Objeknya sama (content-addressed), cukup catat juga dengan key bersama
+        cached = self._image_cache.put_file(self.filepath(name), cached[1])
+        with self._lock:
+            self.report_fallbacks += 1
+        return self._read(name, cached)
+
+    def _read(self, name, cached):
+        digest, path = cached
+        with open(path, 'rb') as f:
+            data = f.read()
+        return TemplateAsset(name, digest, data, path, self.assets[name])
+
+    def _ensure_file(self, asset):
+        """Objek di cache gambar bisa dieviksi; tulis ulang dari memori jika sudah hilang"""
+        if self._image_cache.get(self.filepath(asset.name)):
+            return
+        tmp = self._image_cache.temp_file()
+        with tmp:
+            tmp.write(asset.data)
+        asset.digest, asset.path = self._image_cache.put_file(self.filepath(asset.name), tmp.name, move=True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'assets': {name: self._loaded[name].digest if name in self._loaded else None for name in self.assets},
+                'hits': self.hits,
+                'loads': self.loads,
+                'report_fallbacks': self.report_fallbacks,
+                'negative_ttl': self.negative_ttl,
+            }
@@ -0,0 +1,338 @@
+"""Microbenchmark hot path render LaTeX dan parsing form, dibandingkan dengan baseline tersimpan.
+
+    python bench.py                   # bandingkan dengan bench_baseline.json, exit 1 jika regresi
+    python bench.py --save            # ukur ulang dan simpan sebagai baseline baru
+    python bench.py -k sections       # hanya case yang namanya mengandung "sections"
+
+Laporan sintetis dibuat dengan bentuk yang sama seperti metadata.json di static/uploads
+(dasar teori, section/subsection dengan listing kode dan penjelasan), 1 sampai 200 subsection.
+Waktu yang dicatat adalah waktu per panggilan terbaik dari beberapa putaran bergiliran, alokasi
+puncak diukur dengan tracemalloc pada satu panggilan terpisah. Case yang melewati batas diukur
+ulang dulu, dan selisih di bawah --min-delta (derau timer untuk case berskala mikrodetik) diabaikan. Baseline bergantung pada mesin: simpan
+ulang setelah pindah mesin atau setelah perubahan yang memang disengaja.
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+from werkzeug.datastructures import MultiDict
+
+import app as A
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_baseline.json')
+SIZES = (1, 10, 50, 200)
+
+WORDS = ('deque', 'elemen', 'antrian', 'indeks', 'pointer', 'node', 'data', 'struktur', 'fungsi',
+         'nilai', 'operasi', 'depan', 'belakang', 'kosong', 'penuh', 'program', 'hasil', 'list')
+CODE_LINES = (
+    'class Node:',
+    '    def __init__(self, data):',
+    '        self.data = data',
+    '        self.next = None',
+    'def push_front(self, value):',
+    '    node = Node(value)',
+    '    node.next = self.head',
+    '    self.head = node',
+    'for i in range(len(items)):',
+    '    print(f"{i}: {items[i]}")',
+    'if not self.is_empty():',
+    '    return self.items.pop(0)',
+    'result = {key: value * 2 for key, value in data.items()}',
+    '# cek kondisi antrian sebelum dihapus',
+)
+
+
+def _sentence(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize() + '.'
+
+
+def _paragraph(rng, sentences):
+    return ' '.join(_sentence(rng, rng.randint(6, 14)) for _ in range(sentences))
+
+
+def _code(rng, lines):
+    return '\n'.join(rng.choice(CODE_LINES) for _ in range(lines))
+
+
+def synthetic_report(subsections, seed=0):
+    """Metadata laporan dengan `subsections` subsection (5 per section) dan dasar teori sebanding"""
+    rng = random.Random(seed)
+    dasar_teori_sections = {}
+    for index in range(1, max(1, subsections // 5) + 1):
+        dasar_teori_sections[str(index)] = {
+            'title': f'Dasar Teori {index}',
+            'content': '\n'.join(_paragraph(rng, rng.randint(2, 5)) for _ in range(rng.randint(1, 3))),
+            'image': f'img_{index:04d}.png' if index % 3 == 0 else '',
+        }
+
+    main_sections = {}
+    for index in range(subsections):
+        parent = str(index // 5 + 1)
+        if parent not in main_sections:
+            main_sections[parent] = {'type': 'section', 'title': f'Latihan {parent}'}
+        section_id = f'{parent}_{index % 5 + 1}'
+        main_sections[section_id] = {
+            'type': 'subsection',
+            'title': f'Soal {index + 1}',
+            'parent_section': parent,
+            # Listing praktikum biasanya puluhan sampai ratusan baris
+            'code': _code(rng, rng.randint(20, 150)),
+            'penjelasan': _paragraph(rng, rng.randint(3, 8)),
+            'image': f'img_{index:04d}_out.png' if index % 2 == 0 else '',
+        }
+
+    return {
+        'filename': 'Bench_1_Praktikum_Struktur_Data_Deque',
+        'matkul': 'Praktikum Struktur Data',
+        'pertemuan': '6',
+        'judul': 'Deque',
+        'tanggal': '2025-03-20',
+        'nama': 'Bench',
+        'npm': '24/000000/SV/00000',
+        'kelas': 'PL2A1',
+        'dosen': A.MATKUL_DOSEN['Praktikum Struktur Data'],
+        'tujuan': '\r\n'.join(_sentence(rng, 8) for _ in range(max(3, subsections // 20))),
+        'kesimpulan': _paragraph(rng, 5),
+        'referensi': '\r\n'.join(f'Referensi {i}, w3schools.com, 2025. [Online]. \\url{{https://example.com/{i}}}'
+                                 for i in range(max(2, subsections // 10))),
+        'dasar_teori_sections': dasar_teori_sections,
+        'main_sections': main_sections,
+    }
+
+
+def report_form(metadata):
+    """Field form editor (seperti yang dikirim form.html) untuk metadata laporan"""
+    form = MultiDict()
+    for key in ('nama', 'npm', 'matkul', 'pertemuan', 'judul', 'tanggal', 'kelas', 'dosen',
+                'tujuan', 'kesimpulan', 'referensi'):
+        form.add(key, metadata[key])
+    form.add('action', 'save')
+    for section_id, section in metadata['dasar_teori_sections'].items():
+        form.add(f'dasar_teori_section_id_{section_id}', section_id)
+        form.add(f'dasar_teori_section_title_{section_id}', section['title'])
+        form.add(f'dasar_teori_section_content_{section_id}', section['content'])
+        form.add(f'dasar_teori_section_image_{section_id}', section['image'])
+    for section_id, section in metadata['main_sections'].items():
+        form.add(f'section_type_{section_id}', section['type'])
+        form.add(f'section_title_{section_id}', section['title'])
+        if section['type'] == 'subsection':
+            form.add(f'parent_section_{section_id}', section['parent_section'])
+            form.add(f'code_{section_id}', section['code'])
+            form.add(f'penjelasan_{section_id}', section['penjelasan'])
+            form.add(f'image_{section_id}', section['image'])
+    return form
+
+
+def cold(fn):
+    """Panggil fn tanpa fragmen LaTeX yang sudah di-cache (render penuh)"""
+    def run():
+        with A._fragment_lock:
+            A._fragment_cache.clear()
+        return fn()
+    return run
+
+
+def with_stored_fragments(sections):
+    """Salinan main_sections berisi fragmen tersimpan, seperti hasil load_report(with_fragments=True)"""
+    stored = {}
+    for section_id, section in sections.items():
+        section = dict(section)
+        if section['type'] == 'subsection':
+            section['fragment_hash'], section['latex_fragment'] = A.subsection_fragment(section_id, section)
+        stored[section_id] = section
+    return stored
+
+
+def template_values(metadata):
+    return {
+        'MATKUL': metadata['matkul'], 'PERTEMUAN': metadata['pertemuan'], 'JUDUL': metadata['judul'],
+        'TANGGAL': metadata['tanggal'], 'NAMA': metadata['nama'], 'NPM': metadata['npm'],
+        'KELAS': metadata['kelas'], 'DOSEN': metadata['dosen'],
+        'TUJUAN': A.process_tujuan(metadata['tujuan']),
+        'DASAR_TEORI': A.generate_latex_for_dasar_teori(metadata['dasar_teori_sections']),
+        'HASIL_PEMBAHASAN': A.generate_latex_for_sections(metadata['main_sections']),
+        'KESIMPULAN': metadata['kesimpulan'],
+        'REFERENSI': A.process_referensi(metadata['referensi']),
+    }
+
+
+def cases():
+    """(nama, fungsi tanpa argumen) untuk setiap hot path dan ukuran laporan"""
+    for size in SIZES:
+        metadata = synthetic_report(size, seed=size)
+        form = report_form(metadata)
+        dasar_teori = metadata['dasar_teori_sections']
+        main_sections = metadata['main_sections']
+        values = template_values(metadata)
+        yield f'dasar_teori[{size}]', cold(lambda s=dasar_teori: A.generate_latex_for_dasar_teori(s))
+        yield f'sections[{size}]', cold(lambda s=main_sections: A.generate_latex_for_sections(s))
+        yield f'sections_cached[{size}]', lambda s=main_sections: A.generate_latex_for_sections(s)
+        yield f'sections_stored[{size}]', lambda s=with_stored_fragments(main_sections): A.generate_latex_for_sections(s)
+        yield f'process_tujuan[{size}]', lambda t=metadata['tujuan']: A.process_tujuan(t)
+        yield f'process_referensi[{size}]', lambda t=metadata['referensi']: A.process_referensi(t)
+        yield f'template_render[{size}]', lambda v=values: A.COMPILED_LATEX_TEMPLATE.render(v)
+        yield f'latex_document[{size}]', cold(lambda m=metadata: ''.join(A.iter_latex_document(m)))
+        yield f'parse_form[{size}]', lambda f=form: A.parse_form_sections(f)
+
+
+def measure_time(fn, repeat=7, min_time=0.1):
+    """Waktu per panggilan terbaik (detik) dari `repeat` putaran berisi minimal `min_time` detik"""
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time:
+            break
+        number *= 2 if elapsed * 10 > min_time else 10
+    best = elapsed / number
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat - 1):
+            started = time.perf_counter()
+            for _ in range(number):
+                fn()
+            best = min(best, (time.perf_counter() - started) / number)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return best
+
+
+def measure_peak(fn):
+    """Alokasi puncak (byte) selama satu panggilan"""
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return max(0, peak - before)
+
+
+def run(pattern=None, passes=3):
+    """Ukur semua case yang cocok dengan `pattern`.
+
+    Waktu diukur bergiliran dalam beberapa putaran (bukan semua pengulangan satu case sekaligus),
+    jadi gangguan sesaat dari proses lain tidak hanya mengenai satu case."""
+    selected = {name: fn for name, fn in cases() if not pattern or pattern in name}
+    results = {}
+    for name, fn in selected.items():
+        fn()  # pemanasan
+        results[name] = {'seconds': float('inf'), 'peak_bytes': measure_peak(fn)}
+    for _ in range(passes):
+        for name, fn in selected.items():
+            results[name]['seconds'] = min(results[name]['seconds'], measure_time(fn, repeat=3, min_time=0.05))
+    return results, selected
+
+
+def load_baseline(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f).get('results', {})
+    except FileNotFoundError:
+        return {}
+
+
+def save_baseline(path, results):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'python': sys.version.split()[0], 'results': results}, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def time_regressed(seconds, base, threshold, min_delta):
+    return seconds > base * (1 + threshold) and seconds - base > min_delta
+
+
+def recheck(results, selected, baseline, threshold, min_delta, rounds=2):
+    """Ukur ulang case yang waktunya melewati batas; hanya yang tetap lambat yang dianggap regresi"""
+    for name, result in results.items():
+        base = baseline.get(name)
+        for _ in range(rounds):
+            if not base or not time_regressed(result['seconds'], base['seconds'], threshold, min_delta):
+                break
+            result['seconds'] = min(result['seconds'], measure_time(selected[name]))
+
+
+def compare(results, baseline, threshold, memory_threshold, min_delta):
+    """Cetak tabel perbandingan; kembalikan daftar case yang regresi"""
+    regressions = []
+    print(f"{'case':<28}{'time':>12}{'baseline':>12}{'ratio':>8}{'peak':>12}{'baseline':>12}{'ratio':>8}")
+    for name, result in results.items():
+        base = baseline.get(name)
+        time_ratio = result['seconds'] / base['seconds'] if base and base['seconds'] else None
+        peak_ratio = result['peak_bytes'] / base['peak_bytes'] if base and base['peak_bytes'] else None
+        flag = ''
+        if time_ratio is not None and time_regressed(result['seconds'], base['seconds'], threshold, min_delta):
+            flag += ' TIME'
+        if peak_ratio is not None and peak_ratio > 1 + memory_threshold:
+            flag += ' MEMORY'
+        if flag:
+            regressions.append(name)
+        print(f"{name:<28}{_format_seconds(result['seconds']):>12}"
+              f"{_format_seconds(base['seconds']) if base else '-':>12}"
+              f"{f'{time_ratio:.2f}' if time_ratio is not None else '-':>8}"
+              f"{_format_bytes(result['peak_bytes']):>12}"
+              f"{_format_bytes(base['peak_bytes']) if base else '-':>12}"
+              f"{f'{peak_ratio:.2f}' if peak_ratio is not None else '-':>8}{flag}")
+    return regressions
+
+
+def _format_seconds(seconds):
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:.1f} us"
+    return f"{seconds * 1e3:.2f} ms"
+
+
+def _format_bytes(size):
+    if size < 1024:
+        return f"{size} B"
+    if size < 1024 * 1024:
+        return f"{size / 1024:.1f} KiB"
+    return f"{size / (1024 * 1024):.2f} MiB"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--save', action='store_true', help='simpan hasil sebagai baseline')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='batas kenaikan waktu relatif sebelum dianggap regresi (default 0.25 = +25%%)')
+    parser.add_argument('--memory-threshold', type=float, default=0.10,
+                        help='batas kenaikan alokasi puncak relatif (default 0.10 = +10%%)')
+    parser.add_argument('--min-delta', type=float, default=5e-6,
+                        help='selisih waktu absolut minimum (detik) sebelum dianggap regresi (default 5e-6)')
+    parser.add_argument('-k', dest='pattern', help='hanya case yang namanya mengandung teks ini')
+    args = parser.parse_args()
+
+    results, selected = run(args.pattern)
+    if args.save:
+        baseline = load_baseline(args.baseline) if args.pattern else {}
+        baseline.update(results)
+        save_baseline(args.baseline, baseline)
+        print(f"Saved {len(results)} results to {args.baseline}")
+        return 0
+
+    baseline = load_baseline(args.baseline)
+    recheck(results, selected, baseline, args.threshold, args.min_delta)
+    regressions = compare(results, baseline, args.threshold, args.memory_threshold, args.min_delta)
+    missing = [name for name in results if name not in baseline]
+    if missing:
+        print(f"\n{len(missing)} case tanpa baseline, jalankan dengan --save untuk mencatatnya")
+    if regressions:
+        print(f"\nRegresi di atas batas: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
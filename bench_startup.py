@@ -0,0 +1,65 @@
+"""Benchmark cold start: waktu import app.py sampai response pertama, diukur di proses baru.
+
+    python bench_startup.py                 # 10 kali, GET /metrics
+    python bench_startup.py -n 20 --path /  # termasuk query database pertama
+
+Setiap putaran menjalankan interpreter baru (seperti cold start Vercel) dan mencetak
+median/min/max untuk import, response pertama, dan totalnya.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+PROBE = r"""
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+response = app.app.test_client().get(sys.argv[1])
+response.get_data()
+finished = time.perf_counter()
+print(json.dumps({
+    'import': imported - started,
+    'first_response': finished - imported,
+    'total': finished - started,
+    'status': response.status_code,
+}))
+"""
+
+
+def run_once(path):
+    result = subprocess.run(
+        [sys.executable, '-c', PROBE, path],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else 'probe failed')
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', '--runs', type=int, default=10)
+    parser.add_argument('--path', default='/metrics', help='URL request pertama')
+    parser.add_argument('--json', action='store_true', help='cetak hasil mentah sebagai JSON')
+    args = parser.parse_args()
+
+    samples = [run_once(args.path) for _ in range(args.runs)]
+    if args.json:
+        print(json.dumps(samples, indent=2))
+        return
+
+    statuses = sorted({sample['status'] for sample in samples})
+    print(f"{args.runs} cold starts, GET {args.path} -> {statuses}")
+    for name in ('import', 'first_response', 'total'):
+        values = [sample[name] * 1000 for sample in samples]
+        print(f"  {name:<15} median {statistics.median(values):8.1f} ms"
+              f"   min {min(values):8.1f} ms   max {max(values):8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
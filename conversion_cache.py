@@ -0,0 +1,168 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from telemetry import get_logger
+
+log = get_logger('conversion_cache')
+
+
+class ConversionCache:
+    """Memo hasil konversi dua tingkat: LRU di memori proses di depan penyimpanan persisten.
+
+    `load(key)` / `store(key, value)` mengakses tingkat persisten; kegagalannya hanya dicatat,
+    tidak menggagalkan konversi. Permintaan identik yang datang bersamaan digabung: hanya
+    pemanggil pertama yang menjalankan `compute`, sisanya menunggu hasil yang sama. Pemanggil
+    yang menghitung sendiri (mis. konversi streaming) ikut digabung lewat begin/finish/abort.
+    """
+
+    def __init__(self, load, store, max_entries=1024, wait_timeout=120):
+        self._load = load
+        self._store = store
+        self.max_entries = max_entries
+        self.wait_timeout = wait_timeout
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.counts = {'memory': 0, 'persistent': 0, 'coalesced': 0, 'computed': 0, 'failed': 0}
+
+    def get(self, key, compute):
+        """Kembalikan (value, source) dengan source salah satu kunci `counts` selain 'failed'"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.counts['memory'] += 1
+                return self._entries[key], 'memory'
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+            else:
+                self.counts['coalesced'] += 1
+
+        if not owner:
+            return future.result(timeout=self.wait_timeout), 'coalesced'
+
+        try:
+            value, source = self._resolve(key, compute)
+            self._remember(key, value)
+            future.set_result(value)
+            return value, source
+        except BaseException as e:
+            with self._lock:
+                self.counts['failed'] += 1
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def begin(self, key):
+        """Seperti get() untuk pemanggil yang menghitung sendiri: (value, source) jika sudah ada
+        atau sedang dihitung pemanggil lain (ditunggu). (None, None) berarti pemanggil kini
+        memegang klaim `key` dan wajib mengakhirinya dengan finish() atau abort()."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.counts['memory'] += 1
+                return self._entries[key], 'memory'
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+            else:
+                self.counts['coalesced'] += 1
+
+        if not owner:
+            return future.result(timeout=self.wait_timeout), 'coalesced'
+
+        try:
+            value = self._load(key)
+        except Exception as e:
+            log.warning("Conversion cache lookup failed for %s: %s", key, e)
+            value = None
+        if value is None:
+            return None, None
+        with self._lock:
+            self.counts['persistent'] += 1
+            self._inflight.pop(key, None)
+        self._remember(key, value)
+        future.set_result(value)
+        return value, 'persistent'
+
+    def finish(self, key, value):
+        """Akhiri klaim begin(): simpan `value` dan berikan ke pemanggil yang menunggu"""
+        self.put(key, value)
+        with self._lock:
+            future = self._inflight.pop(key, None)
+        if future is not None:
+            future.set_result(value)
+
+    def abort(self, key, error=None):
+        """Akhiri klaim begin() yang gagal atau dibatalkan; pemanggil yang menunggu menerima `error`"""
+        with self._lock:
+            self.counts['failed'] += 1
+            future = self._inflight.pop(key, None)
+        if future is not None:
+            future.set_exception(error or RuntimeError(f"Conversion {key} was cancelled"))
+
+    def lookup(self, key):
+        """(value, source) dari memori atau penyimpanan persisten tanpa memanggil `compute` (hit tetap
+        masuk `counts`), (None, None) jika tidak ada"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.counts['memory'] += 1
+                return self._entries[key], 'memory'
+        try:
+            value = self._load(key)
+        except Exception as e:
+            log.warning("Conversion cache lookup failed for %s: %s", key, e)
+            return None, None
+        if value is None:
+            return None, None
+        with self._lock:
+            self.counts['persistent'] += 1
+        self._remember(key, value)
+        return value, 'persistent'
+
+    def put(self, key, value):
+        """Simpan hasil yang dihitung di luar get(), mis. dari konversi batch"""
+        with self._lock:
+            self.counts['computed'] += 1
+        self._remember(key, value)
+        try:
+            self._store(key, value)
+        except Exception as e:
+            log.warning("Conversion cache store failed for %s: %s", key, e)
+
+    def _resolve(self, key, compute):
+        try:
+            value = self._load(key)
+        except Exception as e:
+            log.warning("Conversion cache lookup failed for %s: %s", key, e)
+            value = None
+        if value is not None:
+            with self._lock:
+                self.counts['persistent'] += 1
+            return value, 'persistent'
+
+        value = compute()
+        with self._lock:
+            self.counts['computed'] += 1
+        try:
+            self._store(key, value)
+        except Exception as e:
+            log.warning("Conversion cache store failed for %s: %s", key, e)
+        return value, 'computed'
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counts, entries=len(self._entries), inflight=len(self._inflight),
+                        max_entries=self.max_entries)
@@ -1,8 +1,17 @@
 import psycopg2
 from contextlib import contextmanager
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values, Json
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+from psycopg2.pool import PoolError
+import atexit
 import os
+import threading
+import time
+from datetime import datetime, timezone
 import urllib.parse as urlparse
+from telemetry import get_logger, span
+
+log = get_logger('database')
 
 # Ambil URL database dari environment variable
 DATABASE_URL = os.getenv('POSTGRES_URL')
@@ -30,28 +39,642 @@ def clean_dsn(dsn):
 # Bersihkan DATABASE_URL sebelum digunakan
 if DATABASE_URL:
     DATABASE_URL = clean_dsn(DATABASE_URL)
-    print(f"Cleaned DATABASE_URL: {DATABASE_URL}")
+    log.debug("Cleaned DATABASE_URL for host %s", urlparse.urlparse(DATABASE_URL).hostname)
 
 def get_db():
     # Pastikan sslmode=require ada di connection string
     conn = psycopg2.connect(DATABASE_URL, cursor_factory=RealDictCursor)
     return conn
 
+# Mode pool koneksi:
+# - 'pool'   : pool thread-safe dengan ukuran min/max (default untuk server biasa)
+# - 'single' : satu koneksi dipakai ulang per instance hangat (default di Vercel/serverless)
+# - 'off'    : koneksi baru untuk setiap db_connection() seperti sebelumnya
+DB_POOL_MODE = os.getenv('DB_POOL_MODE') or ('single' if os.getenv('VERCEL') else 'pool')
+DB_POOL_MIN = int(os.getenv('DB_POOL_MIN', '1'))
+DB_POOL_MAX = int(os.getenv('DB_POOL_MAX', '10'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '10'))
+DB_POOL_PING_INTERVAL = float(os.getenv('DB_POOL_PING_INTERVAL', '30'))
+DB_POOL_IDLE_TIMEOUT = float(os.getenv('DB_POOL_IDLE_TIMEOUT', '300'))
+
+class ConnectionPool:
+    """Pool koneksi PostgreSQL yang memblokir saat penuh, mengecek koneksi saat checkout,
+    dan membuang koneksi yang rusak. Saat pertama dipakai, pool membuka `minconn` koneksi
+    (sisanya di background) dan tidak pernah menutup koneksi idle di bawah jumlah itu."""
+
+    def __init__(self, minconn, maxconn, timeout, ping_interval, idle_timeout):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.ping_interval = ping_interval
+        self.idle_timeout = idle_timeout
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._idle = []  # (conn, last_used), yang terakhir dipakai ada di ujung
+        self._lock = threading.Lock()
+        self._warmed = False
+        self.created = 0
+        self.reused = 0
+        self.discarded = 0
+
+    def _warm(self):
+        """Buka koneksi idle sampai `minconn` (satu koneksi sudah dibuka oleh pemanggil pertama)"""
+        for _ in range(self.minconn - 1):
+            with self._lock:
+                if len(self._idle) >= self.minconn - 1:
+                    return
+            try:
+                conn = get_db()
+            except psycopg2.Error as e:
+                log.warning("Failed to open warm database connection: %s", e)
+                return
+            with self._lock:
+                self.created += 1
+                # Taruh di depan supaya koneksi yang baru dipakai tetap di ujung
+                self._idle.insert(0, (conn, time.monotonic()))
+
+    def _is_alive(self, conn, last_used):
+        if conn.closed:
+            return False
+        # Koneksi yang baru saja dipakai dianggap hidup, sisanya di-ping
+        if time.monotonic() - last_used < self.ping_interval:
+            return True
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            conn.autocommit = False
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, conn):
+        self.discarded += 1
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def getconn(self):
+        if not self._warmed:
+            with self._lock:
+                warm, self._warmed = not self._warmed and self.minconn > 1, True
+            if warm:
+                threading.Thread(target=self._warm, name='db-pool-warm', daemon=True).start()
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolError(f"No database connection available after {self.timeout}s")
+        try:
+            while True:
+                with self._lock:
+                    item = self._idle.pop() if self._idle else None
+                if item is None:
+                    conn = get_db()
+                    self.created += 1
+                    return conn
+                conn, last_used = item
+                if self._is_alive(conn, last_used):
+                    self.reused += 1
+                    return conn
+                self._discard(conn)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn, discard=False):
+        try:
+            if discard or conn.closed:
+                self._discard(conn)
+                return
+            try:
+                # Tutup transaksi yang masih terbuka (mis. setelah SELECT) sebelum dipakai ulang
+                if conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                self._discard(conn)
+                return
+            now = time.monotonic()
+            with self._lock:
+                self._idle.append((conn, now))
+                expired = []
+                while len(self._idle) > self.minconn and now - self._idle[0][1] > self.idle_timeout:
+                    expired.append(self._idle.pop(0)[0])
+            for old_conn in expired:
+                self._discard(old_conn)
+        finally:
+            self._slots.release()
+
+    def closeall(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._discard(conn)
+
+    def stats(self):
+        with self._lock:
+            idle = len(self._idle)
+        return {
+            'mode': DB_POOL_MODE,
+            'idle': idle,
+            'min': self.minconn,
+            'max': self.maxconn,
+            'created': self.created,
+            'reused': self.reused,
+            'discarded': self.discarded,
+        }
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                if DB_POOL_MODE == 'single':
+                    _pool = ConnectionPool(1, 1, DB_POOL_TIMEOUT, DB_POOL_PING_INTERVAL, float('inf'))
+                else:
+                    _pool = ConnectionPool(DB_POOL_MIN, DB_POOL_MAX, DB_POOL_TIMEOUT, DB_POOL_PING_INTERVAL, DB_POOL_IDLE_TIMEOUT)
+    return _pool
+
 @contextmanager
-def db_connection():
-    conn = get_db()
+def _checkout():
+    if DB_POOL_MODE == 'off':
+        conn = get_db()
+        try:
+            yield conn
+        finally:
+            conn.close()
+        return
+
+    pool = get_pool()
+    conn = pool.getconn()
+    broken = False
     try:
         yield conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        broken = True
+        raise
     finally:
-        conn.close()
+        pool.putconn(conn, discard=broken)
 
-def init_db():
+# Naikkan setiap kali init_db() mengubah skema; instance yang melihat versi lebih lama di database
+# menolak melayani sampai `flask --app app migrate` dijalankan
+SCHEMA_VERSION = 2
+
+class SchemaOutdatedError(RuntimeError):
+    pass
+
+_schema_checked = False
+
+def check_schema(conn):
+    """Pastikan migrasi sudah dijalankan; dicek sekali per proses pada pemakaian database pertama"""
+    global _schema_checked
+    if _schema_checked:
+        return
+    cursor = conn.cursor()
+    cursor.execute("SELECT to_regclass('schema_version') AS t")
+    version = None
+    if cursor.fetchone()['t'] is not None:
+        cursor.execute('SELECT max(version) AS version FROM schema_version')
+        version = cursor.fetchone()['version']
+    if version is None or version < SCHEMA_VERSION:
+        raise SchemaOutdatedError(
+            f"Database schema version is {version or 'missing'}, this build needs {SCHEMA_VERSION}: "
+            "run `flask --app app migrate` against POSTGRES_URL before serving"
+        )
+    _schema_checked = True
+
+@contextmanager
+def db_connection():
+    """Koneksi dari pool selama blok with; durasinya (checkout + query) tercatat sebagai span 'db'"""
+    with span('db'), _checkout() as conn:
+        check_schema(conn)
+        yield conn
+
+class Section:
+    """Satu baris tabel sections"""
+    __slots__ = ('section_id', 'type', 'title', 'content', 'image', 'parent_section', 'fragment_hash', 'latex_fragment')
+
+    def __init__(self, section_id, type, title=None, content=None, image=None, parent_section=None,
+                 fragment_hash=None, latex_fragment=None):
+        self.section_id = section_id
+        self.type = type
+        self.title = title
+        self.content = content
+        self.image = image
+        self.parent_section = parent_section
+        # Fragmen LaTeX hasil render terakhir beserta hash isi section-nya
+        self.fragment_hash = fragment_hash
+        self.latex_fragment = latex_fragment
+
+class Report:
+    """Satu laporan beserta section-nya (urut sesuai urutan simpan)"""
+    __slots__ = ('filename', 'metadata', 'tujuan', 'kesimpulan', 'referensi', 'sections', 'version')
+
+    def __init__(self, filename, metadata, tujuan, kesimpulan, referensi, sections, version=None):
+        self.filename = filename
+        self.metadata = metadata
+        self.tujuan = tujuan
+        self.kesimpulan = kesimpulan
+        self.referensi = referensi
+        self.sections = sections
+        # laporan.updated_at (ISO), berubah di setiap simpan; dipakai sebagai versi hasil render
+        self.version = version
+
+    def split_sections(self):
+        """Kelompokkan section menjadi (dasar_teori_sections, main_sections) seperti di form"""
+        dasar_teori_sections = {}
+        main_sections = {}
+        for section in self.sections:
+            if section.type == 'dasar_teori':
+                dasar_teori_sections[section.section_id.replace('dasar_teori_', '')] = {
+                    'title': section.title,
+                    'content': section.content,
+                    'image': section.image,
+                    'fragment_hash': section.fragment_hash,
+                    'latex_fragment': section.latex_fragment
+                }
+            elif section.type == 'section':
+                main_sections[section.section_id] = {
+                    'type': 'section',
+                    'title': section.title
+                }
+            elif section.type == 'subsection':
+                main_sections[section.section_id] = {
+                    'type': 'subsection',
+                    'title': section.title,
+                    'code': section.content,
+                    'image': section.image,
+                    'parent_section': section.parent_section,
+                    'fragment_hash': section.fragment_hash,
+                    'latex_fragment': section.latex_fragment
+                }
+            elif section.type == 'penjelasan' and section.parent_section in main_sections:
+                main_sections[section.parent_section]['penjelasan'] = section.content
+        return dasar_teori_sections, main_sections
+
+    def to_form_data(self):
+        """Metadata lengkap untuk template form/output dan renderer LaTeX"""
+        form_data = dict(self.metadata)
+        form_data['dasar_teori_sections'], form_data['main_sections'] = self.split_sections()
+        form_data['tujuan'] = self.tujuan
+        form_data['kesimpulan'] = self.kesimpulan
+        form_data['referensi'] = self.referensi
+        return form_data
+
+# Kolom fragmen hanya dibaca jalur render; form/edit tidak perlu salinan LaTeX setiap section
+SECTION_COLUMNS = 's.section_id, s.type, s.title, s.content, s.image, s.parent_section'
+FRAGMENT_COLUMNS = ', s.fragment_hash, s.latex_fragment'
+
+def load_report(filename, with_fragments=False):
+    """Ambil laporan dan seluruh section-nya dalam satu query, None jika tidak ada.
+    `with_fragments` ikut mengambil fragmen LaTeX tersimpan (untuk render)."""
+    columns = SECTION_COLUMNS + (FRAGMENT_COLUMNS if with_fragments else '')
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT l.filename, l.metadata, l.tujuan, l.kesimpulan, l.referensi, l.updated_at,
+                   COALESCE(
+                       json_agg(json_build_array({columns})
+                                ORDER BY s.position NULLS LAST, s.id)
+                       FILTER (WHERE s.id IS NOT NULL),
+                       '[]'
+                   ) AS sections
+            FROM laporan l
+            LEFT JOIN sections s ON s.filename = l.filename
+            WHERE l.filename = %s
+            GROUP BY l.filename
+        ''', (filename,))
+        row = cursor.fetchone()
+    if not row:
+        return None
+    return Report(
+        row['filename'],
+        row['metadata'] or {},
+        row['tujuan'],
+        row['kesimpulan'],
+        row['referensi'],
+        [Section(*values) for values in row['sections']],
+        row['updated_at'].isoformat()
+    )
+
+def report_version(filename):
+    """Versi laporan (updated_at, ISO) tanpa memuat isinya; None jika laporan tidak ada"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT updated_at FROM laporan WHERE filename = %s', (filename,))
+        row = cursor.fetchone()
+    return row['updated_at'].isoformat() if row else None
+
+def sections_from_form(dasar_teori_sections, main_sections):
+    """Ubah dict section dari form menjadi daftar Section sesuai urutan simpan"""
+    sections = []
+    for section_id, section in dasar_teori_sections.items():
+        sections.append(Section(f"dasar_teori_{section_id}", 'dasar_teori', section['title'], section['content'], section['image']))
+    for section_id, section in main_sections.items():
+        if section['type'] == 'section':
+            sections.append(Section(section_id, 'section', section['title']))
+        else:
+            sections.append(Section(section_id, 'subsection', section['title'], section.get('code', ''),
+                                    section.get('image', ''), section.get('parent_section', '')))
+            sections.append(Section(f"penjelasan_{section_id}", 'penjelasan', section['title'],
+                                    section.get('penjelasan', ''), parent_section=section_id))
+    return sections
+
+# Field ini sudah disimpan di kolom tujuan/kesimpulan/referensi dan tabel sections,
+# jadi tidak ikut disimpan di laporan.metadata
+DERIVED_METADATA_KEYS = ('tujuan', 'kesimpulan', 'referensi', 'dasar_teori_sections', 'main_sections')
+LISTING_COLUMNS = ('nama', 'judul', 'matkul', 'tanggal')
+
+def header_metadata(metadata):
+    """Metadata tanpa field yang sudah punya tempat penyimpanan sendiri"""
+    return {key: value for key, value in metadata.items() if key not in DERIVED_METADATA_KEYS}
+
+# Tipe section yang punya fragmen LaTeX tersimpan
+FRAGMENT_TYPES = ('dasar_teori', 'subsection')
+
+def save_report(filename, metadata, tujuan, kesimpulan, referensi, sections, render_fragment=None, fragment_version=None):
+    """Simpan laporan dalam satu transaksi; hanya section yang berubah yang ditulis ulang.
+
+    `render_fragment(section, penjelasan)` mengembalikan (fragment_hash, latex_fragment) dan hanya
+    dipanggil untuk section yang berubah, atau yang fragmen tersimpannya bukan `fragment_version`.
+    Section yang hanya bergeser urutannya tidak ditulis ulang; posisinya diperbarui dalam satu UPDATE.
+    Mengembalikan (jumlah section yang di-insert/update, jumlah yang dihapus)."""
     with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO laporan (filename, metadata, tujuan, kesimpulan, referensi)
+            VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (filename) DO UPDATE
+            SET metadata = EXCLUDED.metadata,
+                tujuan = EXCLUDED.tujuan,
+                kesimpulan = EXCLUDED.kesimpulan,
+                referensi = EXCLUDED.referensi,
+                updated_at = now()
+        ''', (filename, Json(header_metadata(metadata)), tujuan, kesimpulan, referensi))
+
+        cursor.execute('''
+            SELECT section_id, type, title, content, image, parent_section, position, fragment_hash
+            FROM sections WHERE filename = %s FOR UPDATE
+        ''', (filename,))
+        existing = {}
+        stored_positions = {}
+        stored_hashes = {}
+        for row in cursor.fetchall():
+            existing[row['section_id']] = (row['section_id'], row['type'], row['title'], row['content'],
+                                           row['image'], row['parent_section'])
+            stored_positions[row['section_id']] = row['position']
+            stored_hashes[row['section_id']] = row['fragment_hash']
+
+        wanted = {}
+        positions = {}
+        by_id = {}
+        for position, section in enumerate(sections):
+            wanted[section.section_id] = (section.section_id, section.type, section.title, section.content,
+                                          section.image, section.parent_section)
+            positions[section.section_id] = position
+            by_id[section.section_id] = section
+        # Isi dibandingkan tanpa posisi: sisipan di awal laporan tidak membuat section setelahnya berubah
+        changed_ids = {section_id for section_id, row in wanted.items() if existing.get(section_id) != row}
+        # Fragmen subsection memuat penjelasan-nya, yang disimpan sebagai baris terpisah
+        changed_ids.update(by_id[section_id].parent_section for section_id in list(changed_ids)
+                           if by_id[section_id].type == 'penjelasan' and by_id[section_id].parent_section in wanted)
+        if render_fragment is not None:
+            changed_ids.update(
+                section_id for section_id, section in by_id.items()
+                if section.type in FRAGMENT_TYPES and not (stored_hashes.get(section_id) or '').startswith(f"{fragment_version}:")
+            )
+
+        changed = []
+        for section_id in wanted:
+            if section_id not in changed_ids:
+                continue
+            section = by_id[section_id]
+            fragment = (None, None)
+            if render_fragment is not None and section.type in FRAGMENT_TYPES:
+                penjelasan = by_id.get(f"penjelasan_{section_id}")
+                fragment = render_fragment(section, penjelasan.content if penjelasan else '')
+            changed.append((filename,) + wanted[section_id] + (positions[section_id],) + tuple(fragment))
+        moved = [(filename, section_id, position) for section_id, position in positions.items()
+                 if section_id in existing and section_id not in changed_ids and stored_positions[section_id] != position]
+        removed = [section_id for section_id in existing if section_id not in wanted]
+
+        if removed:
+            cursor.execute('DELETE FROM sections WHERE filename = %s AND section_id = ANY(%s)', (filename, removed))
+        if changed:
+            execute_values(cursor, '''
+                INSERT INTO sections (filename, section_id, type, title, content, image, parent_section, position,
+                                      fragment_hash, latex_fragment)
+                VALUES %s
+                ON CONFLICT (filename, section_id) DO UPDATE
+                SET type = EXCLUDED.type,
+                    title = EXCLUDED.title,
+                    content = EXCLUDED.content,
+                    image = EXCLUDED.image,
+                    parent_section = EXCLUDED.parent_section,
+                    position = EXCLUDED.position,
+                    fragment_hash = EXCLUDED.fragment_hash,
+                    latex_fragment = EXCLUDED.latex_fragment
+            ''', changed, page_size=1000)
+        if moved:
+            execute_values(cursor, '''
+                UPDATE sections AS s SET position = v.position
+                FROM (VALUES %s) AS v(filename, section_id, position)
+                WHERE s.filename = v.filename AND s.section_id = v.section_id
+            ''', moved, template='(%s, %s, %s::integer)', page_size=1000)
+        conn.commit()
+    invalidate_report_listing()
+    return len(changed), len(removed)
+
+# Cache daftar laporan per proses; dikosongkan setiap kali laporan disimpan.
+# TTL membatasi data basi dari worker lain.
+REPORT_LIST_CACHE_TTL = float(os.getenv('REPORT_LIST_CACHE_TTL', '60'))
+REPORT_LIST_CACHE_SIZE = 128
+_report_list_cache = {}
+_report_list_lock = threading.Lock()
+
+def invalidate_report_listing():
+    with _report_list_lock:
+        _report_list_cache.clear()
+
+def list_reports(limit=None, after=None, matkul=None, nama=None):
+    """Daftar ringkas laporan (filename, nama, judul, matkul, tanggal), terbaru dulu.
+
+    `after` adalah (tanggal, filename) item terakhir halaman sebelumnya (keyset pagination),
+    `matkul` dicocokkan persis dan `nama` dicari sebagian tanpa membedakan huruf besar/kecil.
+    """
+    key = (limit, after, matkul, nama)
+    now = time.monotonic()
+    with _report_list_lock:
+        cached = _report_list_cache.get(key)
+        if cached and now - cached[0] < REPORT_LIST_CACHE_TTL:
+            return cached[1]
+
+    conditions = []
+    params = []
+    if after:
+        conditions.append('(tanggal, filename) < (%s, %s)')
+        params.extend(after)
+    if matkul:
+        conditions.append('matkul = %s')
+        params.append(matkul)
+    if nama:
+        conditions.append('nama ILIKE %s')
+        params.append(f"%{nama}%")
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    limit_clause = ''
+    if limit:
+        limit_clause = 'LIMIT %s'
+        params.append(limit)
+
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT filename, nama, judul, matkul, tanggal, updated_at
+            FROM laporan
+            {where}
+            ORDER BY tanggal DESC, filename DESC
+            {limit_clause}
+        ''', params)
+        reports = []
+        for row in cursor.fetchall():
+            report = dict(row)
+            report['updated_at'] = row['updated_at'].isoformat()
+            # Seperti sebelumnya, last_modified adalah tanggal laporan (urutan daftar); waktu simpan ada di updated_at
+            report['last_modified'] = row['tanggal']
+            reports.append(report)
+
+    with _report_list_lock:
+        if len(_report_list_cache) >= REPORT_LIST_CACHE_SIZE:
+            _report_list_cache.pop(next(iter(_report_list_cache)))
+        _report_list_cache[key] = (now, reports)
+    return reports
+
+# Hit cache konversi dikumpulkan di memori lalu ditulis per batch, supaya lookup cukup SELECT
+# biasa tanpa transaksi tulis (dan WAL) di setiap konversi
+CONVERSION_HIT_FLUSH_SIZE = int(os.getenv('CONVERSION_HIT_FLUSH_SIZE', '50'))
+CONVERSION_HIT_FLUSH_INTERVAL = float(os.getenv('CONVERSION_HIT_FLUSH_INTERVAL', '60'))
+_conversion_hits = {}  # cache_key -> (jumlah hit, waktu hit terakhir)
+_conversion_hits_lock = threading.Lock()
+_conversion_hits_flushed_at = time.monotonic()
+_conversion_hits_flushing = False
+
+def get_conversion(cache_key):
+    """Hasil konversi LaTeX tersimpan untuk `cache_key`, None jika belum ada"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT latex_text FROM latex_conversions WHERE cache_key = %s', (cache_key,))
+        row = cursor.fetchone()
+    if not row:
+        return None
+    record_conversion_hit(cache_key)
+    return row['latex_text']
+
+def record_conversion_hit(cache_key):
+    """Catat hit di memori; ditulis oleh flush_due_conversion_hits() setelah request selesai"""
+    with _conversion_hits_lock:
+        hits, _ = _conversion_hits.get(cache_key, (0, None))
+        _conversion_hits[cache_key] = (hits + 1, datetime.now(timezone.utc))
+
+def flush_due_conversion_hits():
+    """Flush jika batch sudah penuh atau sudah lama. Dipanggil inline di akhir request, saat koneksi
+    request sudah kembali ke pool: tanpa thread latar yang berebut satu koneksi mode 'single',
+    dan tetap berjalan di serverless yang jarang sampai ke atexit."""
+    global _conversion_hits_flushing
+    with _conversion_hits_lock:
+        due = _conversion_hits and (
+            len(_conversion_hits) >= CONVERSION_HIT_FLUSH_SIZE
+            or time.monotonic() - _conversion_hits_flushed_at >= CONVERSION_HIT_FLUSH_INTERVAL)
+        if not due or _conversion_hits_flushing:
+            return
+        _conversion_hits_flushing = True
+    flush_conversion_hits()
+
+def flush_conversion_hits():
+    """Tulis hit yang terkumpul dalam satu UPDATE; hit dikembalikan ke antrian jika gagal"""
+    global _conversion_hits, _conversion_hits_flushed_at, _conversion_hits_flushing
+    with _conversion_hits_lock:
+        pending, _conversion_hits = _conversion_hits, {}
+        _conversion_hits_flushed_at = time.monotonic()
+    try:
+        if pending:
+            with db_connection() as conn:
+                cursor = conn.cursor()
+                execute_values(cursor, '''
+                    UPDATE latex_conversions AS c
+                    SET hits = c.hits + v.hits, last_used_at = GREATEST(c.last_used_at, v.last_used_at)
+                    FROM (VALUES %s) AS v(cache_key, hits, last_used_at)
+                    WHERE c.cache_key = v.cache_key
+                ''', [(key, hits, last_used) for key, (hits, last_used) in pending.items()],
+                    template='(%s, %s::integer, %s::timestamptz)', page_size=1000)
+                conn.commit()
+    except Exception as e:
+        log.warning("Failed to flush %d conversion cache hits: %s", len(pending), e)
+        with _conversion_hits_lock:
+            for key, (hits, last_used) in pending.items():
+                current, _ = _conversion_hits.get(key, (0, None))
+                _conversion_hits[key] = (current + hits, last_used)
+    finally:
+        with _conversion_hits_lock:
+            _conversion_hits_flushing = False
+
+atexit.register(flush_conversion_hits)
+
+def save_conversion(cache_key, model, latex_text):
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO latex_conversions (cache_key, model, latex_text)
+            VALUES (%s, %s, %s)
+            ON CONFLICT (cache_key) DO NOTHING
+        ''', (cache_key, model, latex_text))
+        conn.commit()
+
+def migrate_laporan_metadata(cursor):
+    """Migrasi laporan.metadata dari TEXT (json.dumps) ke JSONB dengan kolom listing
+    hasil generate. Aman dijalankan berulang kali."""
+    cursor.execute('''
+        SELECT data_type FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'laporan' AND column_name = 'metadata'
+    ''')
+    if cursor.fetchone()['data_type'] != 'jsonb':
+        cursor.execute("ALTER TABLE laporan ALTER COLUMN metadata TYPE JSONB USING NULLIF(metadata, '')::jsonb")
+
+    # Buang duplikasi isi laporan dari baris lama, setelah metadata aslinya disalin utuh ke
+    # laporan_metadata_backup (sekali per laporan) supaya tetap bisa dipulihkan
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS laporan_metadata_backup (
+            filename TEXT PRIMARY KEY,
+            metadata JSONB NOT NULL,
+            backed_up_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+    ''')
+    cursor.execute('''
+        INSERT INTO laporan_metadata_backup (filename, metadata)
+        SELECT filename, metadata FROM laporan WHERE metadata ?| %s::text[]
+        ON CONFLICT (filename) DO NOTHING
+    ''', (list(DERIVED_METADATA_KEYS),))
+    cursor.execute(
+        'UPDATE laporan SET metadata = metadata - %s::text[] WHERE metadata ?| %s::text[]',
+        (list(DERIVED_METADATA_KEYS), list(DERIVED_METADATA_KEYS))
+    )
+
+    for column in LISTING_COLUMNS:
+        cursor.execute(f'''
+            ALTER TABLE laporan ADD COLUMN IF NOT EXISTS {column} TEXT
+            GENERATED ALWAYS AS (COALESCE(metadata->>'{column}', '')) STORED
+        ''')
+    cursor.execute('ALTER TABLE laporan ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now()')
+    cursor.execute('CREATE INDEX IF NOT EXISTS laporan_listing_idx ON laporan (tanggal DESC, filename DESC)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS laporan_matkul_listing_idx ON laporan (matkul, tanggal DESC, filename DESC)')
+
+def init_db():
+    # Tanpa check_schema(): justru ini yang membuat/memigrasi skema
+    with span('db'), _checkout() as conn:
         cursor = conn.cursor()
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS laporan (
                 filename TEXT PRIMARY KEY,
-                metadata TEXT,
+                metadata JSONB,
                 tujuan TEXT,
                 kesimpulan TEXT,
                 referensi TEXT
@@ -67,9 +690,39 @@ def init_db():
                 content TEXT,
                 image TEXT,
                 parent_section TEXT,
+                position INTEGER,
+                fragment_hash TEXT,
+                latex_fragment TEXT,
                 CONSTRAINT fk_laporan
                     FOREIGN KEY (filename)
                     REFERENCES laporan(filename)
             )
         ''')
+        # Migrasi untuk penyimpanan berbasis diff: urutan eksplisit dan kunci unik per laporan
+        cursor.execute('ALTER TABLE sections ADD COLUMN IF NOT EXISTS position INTEGER')
+        # Cache fragmen LaTeX per section (lihat generate_latex_for_dasar_teori/_for_sections)
+        cursor.execute('ALTER TABLE sections ADD COLUMN IF NOT EXISTS fragment_hash TEXT')
+        cursor.execute('ALTER TABLE sections ADD COLUMN IF NOT EXISTS latex_fragment TEXT')
+        cursor.execute("SELECT to_regclass('sections_filename_section_id_key') AS idx")
+        if cursor.fetchone()['idx'] is None:
+            cursor.execute('''
+                DELETE FROM sections a USING sections b
+                WHERE a.filename = b.filename AND a.section_id = b.section_id AND a.id < b.id
+            ''')
+            cursor.execute('CREATE UNIQUE INDEX sections_filename_section_id_key ON sections (filename, section_id)')
+        migrate_laporan_metadata(cursor)
+        # Cache hasil konversi teks -> LaTeX (Gemini), key = hash teks + opsi + versi prompt + model
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS latex_conversions (
+                cache_key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                latex_text TEXT NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                last_used_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            )
+        ''')
+        cursor.execute('CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)')
+        cursor.execute('DELETE FROM schema_version')
+        cursor.execute('INSERT INTO schema_version (version) VALUES (%s)', (SCHEMA_VERSION,))
         conn.commit()
\ No newline at end of file
@@ -0,0 +1,109 @@
+import random
+import threading
+import time
+from googleapiclient.errors import HttpError
+from telemetry import get_logger, span
+
+log = get_logger('drive_batch')
+
+# Drive API menerima paling banyak 100 panggilan per batch request (library mengizinkan 1000)
+DRIVE_BATCH_LIMIT = 100
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+RATE_LIMIT_REASONS = {'rateLimitExceeded', 'userRateLimitExceeded'}
+
+
+def is_retryable(error):
+    """Error sementara (rate limit, 5xx, gangguan koneksi) yang layak diulang"""
+    if not isinstance(error, HttpError):
+        return True
+    status = error.resp.status
+    if status in RETRYABLE_STATUSES:
+        return True
+    if status == 403:
+        details = error.error_details if isinstance(error.error_details, list) else []
+        return any(isinstance(detail, dict) and detail.get('reason') in RATE_LIMIT_REASONS for detail in details)
+    return False
+
+
+class DriveBatch:
+    """Kirim banyak operasi metadata Drive yang saling independen (list, copy, delete, update
+    parents, ...) sebagai multipart batch request berisi sampai `max_batch` operasi.
+
+    Operasi yang gagal sementara diulang dengan exponential backoff; sisanya dilaporkan per
+    operasi, jadi satu file yang gagal tidak menggagalkan operasi lain. Upload media tidak bisa
+    di-batch oleh Drive dan tetap dijalankan satu per satu.
+    """
+
+    def __init__(self, service, max_batch=DRIVE_BATCH_LIMIT, max_attempts=4, backoff=1.0):
+        self._service = service
+        self.max_batch = max(1, min(max_batch, DRIVE_BATCH_LIMIT))
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.operations = 0
+        self.retries = 0
+        self.failed = 0
+
+    def execute(self, requests):
+        """Jalankan HttpRequest `requests`; hasil [(response, error), ...] dengan urutan yang sama"""
+        results = [(None, None)] * len(requests)
+        pending = list(range(len(requests)))
+        attempt = 0
+        while pending:
+            attempt += 1
+            final = attempt >= self.max_attempts
+            retry = []
+            for start in range(0, len(pending), self.max_batch):
+                retry.extend(self._execute_chunk(requests, pending[start:start + self.max_batch], results, final))
+            if not retry:
+                break
+            delay = self.backoff * (2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+            log.warning("Retrying %d Drive operations in %.1fs (attempt %d/%d)",
+                        len(retry), delay, attempt + 1, self.max_attempts)
+            with self._lock:
+                self.retries += len(retry)
+            time.sleep(delay)
+            pending = retry
+
+        failed = sum(1 for _, error in results if error is not None)
+        with self._lock:
+            self.operations += len(requests)
+            self.failed += failed
+        return results
+
+    def _execute_chunk(self, requests, chunk, results, final):
+        """Satu round trip; mengembalikan index operasi yang perlu diulang"""
+        retry = []
+
+        def callback(request_id, response, error):
+            index = int(request_id)
+            results[index] = (response, error)
+            if error is not None and not final and is_retryable(error):
+                retry.append(index)
+
+        batch = self._service().new_batch_http_request(callback=callback)
+        for index in chunk:
+            batch.add(requests[index], request_id=str(index))
+        try:
+            with span('drive', 'batch'):
+                batch.execute()
+        except Exception as e:
+            # Seluruh batch gagal (koneksi, respons multipart rusak): semua operasinya dianggap gagal
+            log.warning("Drive batch request with %d operations failed: %s", len(chunk), e)
+            for index in chunk:
+                results[index] = (None, e)
+            retry = [] if final or not is_retryable(e) else list(chunk)
+        with self._lock:
+            self.batches += 1
+        return sorted(retry)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'batches': self.batches,
+                'operations': self.operations,
+                'retries': self.retries,
+                'failed': self.failed,
+                'max_batch': self.max_batch,
+            }
@@ -0,0 +1,117 @@
+import threading
+import time
+from collections import OrderedDict
+
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+
+
+class FolderManifestCache:
+    """Cache manifest isi folder Google Drive (nama -> file id) dengan TTL dan eviksi LRU.
+
+    Manifest satu folder diisi dari satu listing berpaginasi (`list_folder`), sehingga
+    setelah folder dimuat, pencarian file di dalamnya tidak butuh panggilan metadata Drive.
+    """
+
+    def __init__(self, list_folder, ttl=300, max_folders=256, negative_ttl=10):
+        self._list_folder = list_folder
+        self.ttl = ttl
+        self.max_folders = max_folders
+        # Nama yang tidak ada di manifest yang baru dimuat dianggap memang tidak ada,
+        # supaya miss berulang (mis. logo yang belum diupload) tidak memicu listing ulang
+        self.negative_ttl = negative_ttl
+        self._manifests = OrderedDict()  # parent_id -> (loaded_at, {name: [(id, mimeType), ...]})
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.evictions = 0
+
+    def _get(self, parent_id, max_age):
+        entry = self._manifests.get(parent_id)
+        if entry is None:
+            return None
+        loaded_at, files = entry
+        if time.monotonic() - loaded_at > max_age:
+            return None
+        self._manifests.move_to_end(parent_id)
+        return files
+
+    @staticmethod
+    def _pick(files, name, mime_type):
+        for file_id, file_mime in files.get(name, ()):
+            if mime_type is None or file_mime == mime_type:
+                return file_id
+        return None
+
+    def lookup(self, parent_id, name, mime_type=None):
+        """Cari id file `name` di folder `parent_id`, muat ulang manifest jika perlu"""
+        with self._lock:
+            files = self._get(parent_id, self.ttl)
+            if files is not None:
+                file_id = self._pick(files, name, mime_type)
+                if file_id:
+                    self.hits += 1
+                    return file_id
+                if self._get(parent_id, self.negative_ttl) is not None:
+                    self.hits += 1
+                    return None
+            self.misses += 1
+
+        files = self.refresh(parent_id)
+        return self._pick(files, name, mime_type)
+
+    def refresh(self, parent_id):
+        """Muat manifest folder dari Drive (satu listing berpaginasi)"""
+        files = {}
+        for item in self._list_folder(parent_id):
+            files.setdefault(item['name'], []).append((item['id'], item.get('mimeType')))
+
+        with self._lock:
+            self.loads += 1
+            self._manifests[parent_id] = (time.monotonic(), files)
+            self._manifests.move_to_end(parent_id)
+            while len(self._manifests) > self.max_folders:
+                self._manifests.popitem(last=False)
+                self.evictions += 1
+        return files
+
+    def entries(self, parent_id):
+        """Daftar (name, id, mimeType) isi folder, dari cache jika masih segar"""
+        with self._lock:
+            files = self._get(parent_id, self.ttl)
+        if files is None:
+            files = self.refresh(parent_id)
+        return [(name, file_id, mime) for name, items in files.items() for file_id, mime in items]
+
+    def remember(self, parent_id, name, file_id, mime_type=None):
+        """Catat file yang baru dibuat supaya tidak perlu listing ulang"""
+        with self._lock:
+            entry = self._manifests.get(parent_id)
+            if entry is not None:
+                entry[1].setdefault(name, []).insert(0, (file_id, mime_type))
+
+    def forget(self, parent_id, name=None):
+        """Hapus satu nama dari manifest, atau seluruh manifest jika `name` kosong"""
+        with self._lock:
+            if name is None:
+                self._manifests.pop(parent_id, None)
+                return
+            entry = self._manifests.get(parent_id)
+            if entry is not None:
+                entry[1].pop(name, None)
+
+    def clear(self):
+        with self._lock:
+            self._manifests.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'loads': self.loads,
+                'evictions': self.evictions,
+                'folders_cached': len(self._manifests),
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
@@ -0,0 +1,135 @@
+import hashlib
+import os
+import tempfile
+import threading
+
+
+class LocalImageCache:
+    """Cache gambar di disk lokal, content-addressed (sha256) dengan batas ukuran dan eviksi LRU.
+
+    `objects/<sha256>` menyimpan isi gambar, `keys/<sha1(filepath)>` menyimpan hash isi
+    untuk filepath Drive. File key tetap ada walau objeknya dieviksi, sehingga ETag masih
+    bisa dijawab 304 tanpa menyentuh Drive.
+    """
+
+    CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, root, max_bytes=256 * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.objects_dir = os.path.join(root, 'objects')
+        self.keys_dir = os.path.join(root, 'keys')
+        self._lock = threading.Lock()
+        self._ready = False
+        self._size = 0
+
+    def _ensure_dirs(self):
+        """Buat direktori cache saat pertama dipakai, bukan saat import"""
+        if self._ready:
+            return
+        with self._lock:
+            if not self._ready:
+                os.makedirs(self.objects_dir, exist_ok=True)
+                os.makedirs(self.keys_dir, exist_ok=True)
+                self._size = sum(entry.stat().st_size for entry in os.scandir(self.objects_dir) if entry.is_file())
+                self._ready = True
+
+    def _key_path(self, key):
+        return os.path.join(self.keys_dir, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def object_path(self, digest):
+        return os.path.join(self.objects_dir, digest)
+
+    def etag_for(self, key):
+        """Hash isi gambar terakhir untuk `key`, atau None jika belum pernah di-cache"""
+        try:
+            with open(self._key_path(key), 'r', encoding='ascii') as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def get(self, key):
+        """Kembalikan (digest, path) jika objek gambar ada di disk"""
+        digest = self.etag_for(key)
+        if not digest:
+            return None
+        path = self.object_path(digest)
+        try:
+            # mtime dipakai sebagai penanda LRU
+            os.utime(path, None)
+        except OSError:
+            return None
+        return digest, path
+
+    def temp_file(self):
+        """File sementara di dalam direktori cache (satu filesystem, jadi bisa di-rename)"""
+        self._ensure_dirs()
+        return tempfile.NamedTemporaryFile(dir=self.root, prefix='tmp_', delete=False)
+
+    def put_file(self, key, src_path, move=False):
+        """Simpan file ke cache dan catat hash-nya untuk `key`"""
+        self._ensure_dirs()
+        sha = hashlib.sha256()
+        with open(src_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(self.CHUNK_SIZE), b''):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+        path = self.object_path(digest)
+
+        with self._lock:
+            if os.path.exists(path):
+                if move:
+                    os.remove(src_path)
+                os.utime(path, None)
+            else:
+                if move:
+                    os.replace(src_path, path)
+                else:
+                    with self.temp_file() as tmp, open(src_path, 'rb') as f:
+                        for chunk in iter(lambda: f.read(self.CHUNK_SIZE), b''):
+                            tmp.write(chunk)
+                    os.replace(tmp.name, path)
+                self._size += os.path.getsize(path)
+
+            key_tmp = f"{self._key_path(key)}.{os.getpid()}.{threading.get_ident()}"
+            with open(key_tmp, 'w', encoding='ascii') as f:
+                f.write(digest)
+            os.replace(key_tmp, self._key_path(key))
+            self._evict(keep=digest)
+        return digest, path
+
+    def invalidate(self, key):
+        try:
+            os.remove(self._key_path(key))
+        except OSError:
+            pass
+
+    def _evict(self, keep=None):
+        if self._size <= self.max_bytes:
+            return
+        entries = sorted(
+            (entry for entry in os.scandir(self.objects_dir) if entry.is_file()),
+            key=lambda entry: entry.stat().st_mtime
+        )
+        # Turunkan sampai 90% kapasitas supaya tidak eviksi di setiap put
+        target = int(self.max_bytes * 0.9)
+        for entry in entries:
+            if self._size <= target:
+                break
+            if entry.name == keep:
+                continue
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+                self._size -= size
+            except OSError:
+                pass
+
+    def stats(self):
+        self._ensure_dirs()
+        with self._lock:
+            return {
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'objects': len(os.listdir(self.objects_dir)),
+            }
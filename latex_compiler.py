@@ -0,0 +1,267 @@
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from telemetry import get_logger
+
+log = get_logger('latex_compiler')
+
+# Penanda akhir preamble yang bisa di-dump ke format file (lihat paket mylatexformat)
+END_OF_DUMP = '%endofdump'
+
+
+class CompileError(Exception):
+    """Kompilasi LaTeX gagal; `log` berisi potongan akhir log engine"""
+
+    def __init__(self, message, log=''):
+        super().__init__(message)
+        self.log = log
+
+
+class LatexCompiler:
+    """Kompilasi .tex ke PDF di worker pool dengan timeout per job dan direktori kerja terisolasi.
+
+    Preamble sebelum `%endofdump` dikompilasi sekali menjadi format file (mylatexformat),
+    dan hasil PDF di-cache berdasarkan hash isi .tex dan hash semua gambar.
+    """
+
+    def __init__(self, cache_dir, engine='pdflatex', workers=2, timeout=60, passes=2, max_cached=200):
+        self.engine = engine
+        self.timeout = timeout
+        self.passes = passes
+        self.max_cached = max_cached
+        self.pdf_dir = os.path.join(cache_dir, 'pdf')
+        self.format_dir = os.path.join(cache_dir, 'formats')
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='latex')
+        self._workers = workers
+        self._lock = threading.Lock()
+        self._formats = {}  # hash preamble -> Future berisi nama format, atau None jika gagal dibuat
+        self._inflight = {}
+        self._durations = deque(maxlen=200)
+        self._waits = deque(maxlen=200)
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.cache_hits = 0
+
+    def available(self):
+        return shutil.which(self.engine) is not None
+
+    @staticmethod
+    def cache_key(tex, images):
+        sha = hashlib.sha256(tex.encode('utf-8'))
+        for arcname, _, digest in sorted(images):
+            sha.update(f"\0{arcname}\0{digest}".encode('utf-8'))
+        return sha.hexdigest()
+
+    def cached_pdf(self, key):
+        path = os.path.join(self.pdf_dir, f"{key}.pdf")
+        if os.path.exists(path):
+            os.utime(path, None)
+            return path
+        return None
+
+    def submit(self, tex, images):
+        """Jadwalkan kompilasi. `images` berisi (arcname, path lokal, digest isi).
+        Mengembalikan (key, future) dengan hasil path PDF; job identik digabung."""
+        key = self.cache_key(tex, images)
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return key, future
+            pdf_path = self.cached_pdf(key)
+            if pdf_path:
+                self.cache_hits += 1
+                future = Future()
+                future.set_result(pdf_path)
+                return key, future
+            self.queued += 1
+            future = self._pool.submit(self._compile, key, tex, images, time.monotonic())
+            self._inflight[key] = future
+        future.add_done_callback(lambda _: self._forget(key))
+        return key, future
+
+    def _forget(self, key):
+        with self._lock:
+            self._inflight.pop(key, None)
+
+    def _run(self, args, cwd, env, deadline):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise subprocess.TimeoutExpired(args, 0)
+        return subprocess.run(
+            args, cwd=cwd, env=env, stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=remaining
+        )
+
+    def _sandbox_env(self):
+        env = {
+            'PATH': os.environ.get('PATH', ''),
+            'HOME': tempfile.gettempdir(),
+            # Larang menulis/membaca file di luar direktori kerja job
+            'openout_any': 'p',
+            'openin_any': 'p',
+            'shell_escape': 'f',
+        }
+        env['TEXFORMATS'] = f"{self.format_dir}{os.pathsep}"
+        return env
+
+    def _ensure_format(self, tex, deadline):
+        """Dump preamble ke format file sekali per isi preamble; None jika tidak tersedia"""
+        if END_OF_DUMP not in tex:
+            return None
+        preamble = tex.split(END_OF_DUMP, 1)[0]
+        digest = hashlib.sha256(f"{self.engine}\0{preamble}".encode('utf-8')).hexdigest()[:16]
+        # Satu Future per preamble: job dengan preamble sama menunggu dump yang sedang berjalan,
+        # job dengan preamble lain tidak ikut tertahan
+        with self._lock:
+            future = self._formats.get(digest)
+            owner = future is None
+            if owner:
+                future = self._formats[digest] = Future()
+        if not owner:
+            try:
+                return future.result(timeout=max(0, deadline - time.monotonic()))
+            except FuturesTimeoutError:
+                raise subprocess.TimeoutExpired('format dump', self.timeout)
+
+        name = None
+        try:
+            name = self._dump_format(f"preamble_{digest}", preamble, deadline)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            log.warning("Failed to precompile LaTeX preamble: %s", e)
+        finally:
+            future.set_result(name)
+        return name
+
+    def _dump_format(self, name, preamble, deadline):
+        """Buat `<name>.fmt` di format_dir; mengembalikan nama format atau None jika gagal"""
+        if os.path.exists(os.path.join(self.format_dir, f"{name}.fmt")):
+            return name
+        work_dir = tempfile.mkdtemp(prefix='fmt_')
+        try:
+            with open(os.path.join(work_dir, 'preamble.tex'), 'w', encoding='utf-8') as f:
+                f.write(preamble + END_OF_DUMP + '\n\\begin{document}\n\\end{document}\n')
+            result = self._run(
+                [self.engine, '-ini', '-interaction=nonstopmode', '-no-shell-escape',
+                 f"-jobname={name}", f"&{self.engine}", 'mylatexformat.ltx', 'preamble.tex'],
+                work_dir, self._sandbox_env(), deadline
+            )
+            fmt_path = os.path.join(work_dir, f"{name}.fmt")
+            if result.returncode == 0 and os.path.exists(fmt_path):
+                os.replace(fmt_path, os.path.join(self.format_dir, f"{name}.fmt"))
+                return name
+            log.warning("Failed to precompile LaTeX preamble, compiling without format file")
+            return None
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def _compile(self, key, tex, images, submitted_at):
+        started = time.monotonic()
+        deadline = started + self.timeout
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+            self._waits.append(started - submitted_at)
+
+        work_dir = tempfile.mkdtemp(prefix='latex_')
+        try:
+            # Direktori cache dibuat saat kompilasi pertama, bukan saat import
+            os.makedirs(self.pdf_dir, exist_ok=True)
+            os.makedirs(self.format_dir, exist_ok=True)
+            with open(os.path.join(work_dir, 'main.tex'), 'w', encoding='utf-8') as f:
+                f.write(tex)
+            for arcname, path, _ in images:
+                shutil.copyfile(path, os.path.join(work_dir, os.path.basename(arcname)))
+
+            fmt = self._ensure_format(tex, deadline)
+            try:
+                self._compile_passes(work_dir, fmt, deadline)
+            except CompileError:
+                if not fmt:
+                    raise
+                # Format file bisa bermasalah dengan paket tertentu: ulangi tanpa format
+                self._compile_passes(work_dir, None, deadline)
+
+            pdf_path = os.path.join(self.pdf_dir, f"{key}.pdf")
+            os.replace(os.path.join(work_dir, 'main.pdf'), pdf_path)
+            self._evict()
+            with self._lock:
+                self.completed += 1
+            return pdf_path
+        except subprocess.TimeoutExpired:
+            with self._lock:
+                self.timeouts += 1
+                self.failed += 1
+            raise CompileError(f"LaTeX compilation timed out after {self.timeout}s")
+        except Exception:
+            with self._lock:
+                self.failed += 1
+            raise
+        finally:
+            with self._lock:
+                self.running -= 1
+                self._durations.append(time.monotonic() - started)
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def _compile_passes(self, work_dir, fmt, deadline):
+        args = [self.engine, '-interaction=nonstopmode', '-halt-on-error', '-no-shell-escape']
+        if fmt:
+            args.append(f"-fmt={fmt}")
+        args.append('main.tex')
+        # Lebih dari satu pass supaya daftar isi dan referensi terisi
+        for _ in range(self.passes):
+            result = self._run(args, work_dir, self._sandbox_env(), deadline)
+            if result.returncode != 0 or not os.path.exists(os.path.join(work_dir, 'main.pdf')):
+                engine_log = result.stdout.decode('utf-8', errors='replace')[-4000:]
+                raise CompileError('LaTeX compilation failed', engine_log)
+
+    def _evict(self):
+        entries = sorted(
+            (entry for entry in os.scandir(self.pdf_dir) if entry.name.endswith('.pdf')),
+            key=lambda entry: entry.stat().st_mtime,
+            reverse=True
+        )
+        for entry in entries[self.max_cached:]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+    @staticmethod
+    def _summary(values):
+        if not values:
+            return {'count': 0, 'p50': None, 'p95': None, 'max': None}
+        ordered = sorted(values)
+        return {
+            'count': len(ordered),
+            'p50': round(ordered[len(ordered) // 2], 3),
+            'p95': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+            'max': round(ordered[-1], 3),
+        }
+
+    def stats(self):
+        with self._lock:
+            return {
+                'engine': self.engine,
+                'available': self.available(),
+                'workers': self._workers,
+                'timeout': self.timeout,
+                'queue_depth': self.queued,
+                'running': self.running,
+                'completed': self.completed,
+                'failed': self.failed,
+                'timeouts': self.timeouts,
+                'cache_hits': self.cache_hits,
+                'compile_seconds': self._summary(self._durations),
+                'queue_wait_seconds': self._summary(self._waits),
+                'formats': {digest: future.done() and future.result() is not None
+                            for digest, future in self._formats.items()},
+            }
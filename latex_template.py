@@ -0,0 +1,43 @@
+import re
+
+
+class CompiledTemplate:
+    """Template LaTeX yang di-parse sekali menjadi potongan literal dan slot bernama.
+
+    Slot ditulis sebagai `<<NAMA_SLOT>>`. Render dilakukan satu kali jalan dengan join,
+    jadi isi yang sudah dimasukkan tidak pernah dipindai ulang untuk slot lain.
+    """
+
+    SLOT_PATTERN = re.compile(r'<<([A-Z][A-Z0-9_]*)>>')
+
+    def __init__(self, source):
+        self.segments = []
+        self.slots = []
+        position = 0
+        for match in self.SLOT_PATTERN.finditer(source):
+            self.segments.append(source[position:match.start()])
+            self.slots.append(match.group(1))
+            position = match.end()
+        self.segments.append(source[position:])
+        self.slot_names = frozenset(self.slots)
+
+    def render(self, values):
+        """Isi semua slot dari dict `values`; slot yang tidak ada atau None menjadi string kosong"""
+        parts = [self.segments[0]]
+        for slot, literal in zip(self.slots, self.segments[1:]):
+            parts.append(values.get(slot) or '')
+            parts.append(literal)
+        return ''.join(parts)
+
+    def iter_render(self, values):
+        """Seperti render(), tapi menghasilkan potongan satu per satu.
+        Nilai slot boleh string atau iterable string (misalnya generator fragmen section)."""
+        yield self.segments[0]
+        for slot, literal in zip(self.slots, self.segments[1:]):
+            value = values.get(slot)
+            if isinstance(value, str):
+                if value:
+                    yield value
+            elif value is not None:
+                yield from value
+            yield literal
@@ -0,0 +1,263 @@
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+# Batas bucket histogram durasi (detik)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# Batas bucket jumlah pemanggilan per request
+CALL_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+# Porsi record di bawah WARNING yang benar-benar ditulis (1 = semua)
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', '1'))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{_escape(extra[1])}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Counter Prometheus dengan label"""
+
+    type = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Histogram:
+    """Histogram Prometheus dengan bucket kumulatif dan label"""
+
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self._values = {}  # label -> [hitungan per bucket, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, ('le', _format_value(float(bound))))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(round(total, 6))}"
+            yield f"{self.name}_count{labels} {count}"
+
+
+class MetricsRegistry:
+    """Kumpulan metrik yang dirender ke format teks Prometheus untuk /metrics"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, help, labelnames=()):
+        metric = Counter(name, help, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+SPAN_SECONDS = REGISTRY.histogram(
+    'laporan_span_seconds', 'Durasi operasi (Postgres, Drive, Gemini, render, encode gambar)', ('span', 'op')
+)
+SPAN_ERRORS = REGISTRY.counter(
+    'laporan_span_errors_total', 'Operasi yang berakhir dengan exception', ('span', 'op')
+)
+REQUEST_SECONDS = REGISTRY.histogram(
+    'laporan_request_seconds', 'Durasi request HTTP per endpoint', ('endpoint', 'method', 'status')
+)
+REQUEST_CALLS = REGISTRY.histogram(
+    'laporan_request_calls', 'Jumlah operasi per request HTTP per jenis span', ('endpoint', 'span'), CALL_BUCKETS
+)
+
+# Jenis span yang jumlahnya selalu dicatat per request, walau nol
+TRACKED_SPANS = ('db', 'drive', 'gemini')
+
+_local = threading.local()
+
+
+class RequestTrace:
+    """Hitungan span selama satu request, bisa dibagi ke thread worker lewat bind()"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.calls = {}
+        self._lock = threading.Lock()
+
+    def count(self, name):
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+
+def begin_request():
+    _local.trace = RequestTrace()
+    return _local.trace
+
+
+def end_request(endpoint, method, status):
+    trace = getattr(_local, 'trace', None)
+    if trace is None:
+        return
+    _local.trace = None
+    REQUEST_SECONDS.observe(time.perf_counter() - trace.started, endpoint=endpoint, method=method, status=status)
+    with trace._lock:
+        calls = dict(trace.calls)
+    for name in set(TRACKED_SPANS) | set(calls):
+        REQUEST_CALLS.observe(calls.get(name, 0), endpoint=endpoint, span=name)
+
+
+def bind(fn):
+    """Bungkus fn supaya span di thread lain tetap dihitung ke request pemanggil"""
+    trace = getattr(_local, 'trace', None)
+    if trace is None:
+        return fn
+
+    def bound(*args, **kwargs):
+        previous = getattr(_local, 'trace', None)
+        _local.trace = trace
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _local.trace = previous
+    return bound
+
+
+@contextmanager
+def span(name, op=''):
+    """Ukur durasi satu operasi ke histogram laporan_span_seconds{span, op}"""
+    trace = getattr(_local, 'trace', None)
+    if trace is not None:
+        trace.count(name)
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        SPAN_ERRORS.inc(span=name, op=op)
+        raise
+    finally:
+        SPAN_SECONDS.observe(time.perf_counter() - started, span=name, op=op)
+
+
+def timed_iter(name, op, iterable):
+    """Seperti span(), untuk generator: hanya waktu di dalam next() yang dihitung,
+    bukan waktu menunggu klien membaca potongan sebelumnya"""
+    trace = getattr(_local, 'trace', None)
+    if trace is not None:
+        trace.count(name)
+    iterator = iter(iterable)
+    elapsed = 0.0
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                elapsed += time.perf_counter() - started
+                break
+            elapsed += time.perf_counter() - started
+            yield chunk
+    except BaseException:
+        SPAN_ERRORS.inc(span=name, op=op)
+        raise
+    finally:
+        SPAN_SECONDS.observe(elapsed, span=name, op=op)
+
+
+class SamplingFilter(logging.Filter):
+    """Loloskan semua record WARNING ke atas, record di bawahnya disampel sebesar `rate`"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or self.rate >= 1 or random.random() < self.rate
+
+
+def _configure_logging():
+    root = logging.getLogger('laporan')
+    if root.handlers:
+        return root
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    handler.addFilter(SamplingFilter(LOG_SAMPLE_RATE))
+    root.addHandler(handler)
+    root.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
+    root.propagate = False
+    return root
+
+
+_configure_logging()
+
+
+def get_logger(name):
+    """Logger anak 'laporan'; pakai argumen %s (bukan f-string) supaya format dilewati saat level nonaktif"""
+    return logging.getLogger(f'laporan.{name}')
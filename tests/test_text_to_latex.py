@@ -0,0 +1,48 @@
+import unittest
+
+from text_to_latex import convert_simple, sanitize_latex, stable_latex_prefix
+
+
+class DunderNameTest(unittest.TestCase):
+    """Nama dunder Python tidak boleh dianggap penanda tebal/miring"""
+
+    def test_init(self):
+        self.assertEqual(convert_simple('__init__ method'), r'\_\_init\_\_ method')
+
+    def test_name_main(self):
+        self.assertEqual(convert_simple('if __name__ == "__main__":'),
+                         r'if \_\_name\_\_ == "\_\_main\_\_":')
+
+    def test_str(self):
+        self.assertEqual(convert_simple('method __str__ dan _private'),
+                         r'method \_\_str\_\_ dan \_private')
+
+    def test_asterisk_emphasis(self):
+        self.assertEqual(convert_simple('**tebal** dan *miring*'), r'\textbf{tebal} dan \textit{miring}')
+
+
+class ParagraphAfterEnvironmentTest(unittest.TestCase):
+    """Baris kosong setelah \\end{...} memisahkan paragraf dan harus dipertahankan"""
+
+    def test_list_then_paragraph(self):
+        self.assertTrue(convert_simple('* a\n* b\n\nteks').endswith('\\end{itemize}\n\nteks'))
+
+    def test_sanitize_keeps_blank_line_after_end(self):
+        self.assertEqual(sanitize_latex('\\begin{itemize}\n\\item a\n\\end{itemize}\n\nteks'),
+                         '\\begin{itemize}\\item a\n\\end{itemize}\n\nteks')
+
+    def test_sanitize_joins_single_newline_after_end(self):
+        self.assertEqual(sanitize_latex('\\end{itemize}\nteks'), '\\end{itemize}teks')
+
+    def test_sanitize_joins_after_begin(self):
+        self.assertEqual(sanitize_latex('\\begin{itemize}\n\n\\item a'), '\\begin{itemize}\\item a')
+
+    def test_stable_prefix(self):
+        text = '\\begin{itemize}\n\\item a\n\\end{itemize}\n\nteks\nlanjut'
+        prefix = stable_latex_prefix(text)
+        self.assertEqual(prefix, '\\begin{itemize}\\item a\n\\end{itemize}\n\nteks')
+        self.assertTrue(sanitize_latex(text).startswith(prefix))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,206 @@
+import re
+
+# Escape yang dibuat escapeLatex() di form.html; dibalik dulu supaya teks dari form dan teks mentah
+# diperlakukan sama. escapeLatex mengganti kurung kurawal setelah backslash, jadi \textbackslash
+# bisa datang sebagai \textbackslash{} atau \textbackslash\{\}.
+CLIENT_ESCAPE_PATTERN = re.compile(r'\\textbackslash(?:\{\}|\\\{\\\})|\\textasciitilde\{\}|\\([%$#_{}&^])')
+
+LATEX_SPECIALS = {
+    '\\': r'\textbackslash{}', '&': r'\&', '%': r'\%', '$': r'\$', '#': r'\#', '_': r'\_',
+    '{': r'\{', '}': r'\}', '~': r'\textasciitilde{}', '^': r'\textasciicircum{}',
+}
+LATEX_SPECIAL_PATTERN = re.compile(r'[\\&%$#_{}~^]')
+URL_SPECIAL_PATTERN = re.compile(r'[%#]')
+
+# Kode inline, URL, tebal (**x**), miring (*x*). Penanda dengan garis bawah (__x__/_x_) sengaja
+# tidak didukung: di materi Python garis bawah hampir selalu bagian nama (__init__, __name__).
+INLINE_PATTERN = re.compile(
+    r'`(?P<code>[^`\n]+)`'
+    r'|(?P<url>https?://[^\s<>()`]*[^\s<>()`.,;:!?\'"])'
+    r'|\*\*(?=\S)(?P<bold>.+?)(?<=\S)\*\*'
+    r'|(?<![\w*])\*(?=[^\s*])(?P<italic>[^*\n]+?)(?<=\S)\*(?![\w*])'
+)
+
+BULLET_PATTERN = re.compile(r'^(?P<indent>[ \t]*)[-*\u2022][ \t]+(?P<text>\S.*)$')
+NUMBERED_PATTERN = re.compile(r'^(?P<indent>[ \t]*)(?P<number>\d{1,3})[.)][ \t]+(?P<text>\S.*)$')
+# Markdown yang tidak ditangani di sini: judul, kutipan, tabel, blok kode, matematika
+UNSUPPORTED_LINE_PATTERN = re.compile(r'^\s*(?:#{1,6}\s|>|```|\|.*\||\$\$)')
+
+# Satu pass untuk membersihkan keluaran model: buang preamble/struktur dokumen dan komentar,
+# dan rapikan pergantian baris (digabung setelah \begin/\end{...} dan sebelum \item; baris kosong
+# setelah \end{...} tetap dipertahankan sebagai pemisah paragraf)
+SANITIZE_PATTERN = re.compile(
+    r'(?P<drop>\\documentclass(?:\[[^\]\n]*\])?\{[^}\n]*\}'
+    r'|\\usepackage(?:\[[^\]\n]*\])?\{[^}\n]*\}'
+    r'|\\(?:begin|end)\{document\})'
+    r'|(?P<comment>(?<!\\)%[^\n]*)'
+    r'|(?P<env>\\(?:begin|end)\{[^}\n]*\})'
+    r'|(?P<space>[ \t\r\f\v]*\n\s*)'
+)
+
+
+class NotConfident(Exception):
+    """Teks memakai sesuatu yang tidak bisa dikonversi dengan pasti oleh aturan lokal"""
+
+
+def _sanitize(text):
+    """Kembalikan (hasil, panjang prefix hasil yang sudah final untuk teks yang masih mengalir)"""
+    parts = []
+    length = 0
+    stable = 0
+    after_env = None
+    pos = 0
+    for match in SANITIZE_PATTERN.finditer(text):
+        if match.start() > pos:
+            parts.append(text[pos:match.start()])
+            length += match.start() - pos
+            after_env = None
+        pos = match.end()
+        kind = match.lastgroup
+        if kind == 'env':
+            parts.append(match.group())
+            length += len(match.group())
+            after_env = match.group()[1:match.group().index('{')]
+        elif kind == 'space':
+            if pos < len(text):
+                # Pergantian baris diikuti teks: semua hasil sebelum titik ini tidak akan berubah
+                stable = length
+            blank_line = match.group().count('\n') > 1
+            if text.startswith('\\item', pos) or (after_env and not (after_env == 'end' and blank_line)):
+                continue
+            separator = '\n\n' if blank_line else match.group()
+            parts.append(separator)
+            length += len(separator)
+    parts.append(text[pos:])
+    return ''.join(parts), stable
+
+
+def sanitize_latex(text):
+    """Bersihkan potongan LaTeX (mis. keluaran Gemini) dalam satu pass regex"""
+    return _sanitize(text.strip())[0].strip()
+
+
+def stable_latex_prefix(text):
+    """Bagian hasil sanitize_latex(text) yang tidak berubah lagi jika teks masih bertambah;
+    selalu merupakan prefix dari hasil akhir"""
+    result, stable = _sanitize(text.lstrip())
+    return result[:stable].strip()
+
+
+def unescape_client(text):
+    return CLIENT_ESCAPE_PATTERN.sub(lambda m: m.group(1) or ('\\' if m.group().startswith('\\textbackslash') else '~'), text)
+
+
+def escape_latex(text):
+    return LATEX_SPECIAL_PATTERN.sub(lambda m: LATEX_SPECIALS[m.group()], text)
+
+
+def _literal(text):
+    # Sisa penanda markdown yang tidak berpasangan berarti inputnya tidak sesederhana dugaan
+    if '`' in text or '**' in text:
+        raise NotConfident('unbalanced markup')
+    return escape_latex(text)
+
+
+def convert_inline(text):
+    parts = []
+    pos = 0
+    for match in INLINE_PATTERN.finditer(text):
+        parts.append(_literal(text[pos:match.start()]))
+        pos = match.end()
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == 'code':
+            parts.append(f"\\texttt{{{escape_latex(value)}}}")
+        elif kind == 'url':
+            if '{' in value or '}' in value:
+                raise NotConfident('url with braces')
+            url = URL_SPECIAL_PATTERN.sub(r'\\\g<0>', value)
+            parts.append(f"\\url{{{url}}}")
+        elif kind == 'bold':
+            parts.append(f"\\textbf{{{convert_inline(value)}}}")
+        else:
+            parts.append(f"\\textit{{{convert_inline(value)}}}")
+    parts.append(_literal(text[pos:]))
+    return ''.join(parts)
+
+
+def _list_item(line):
+    for kind, pattern in (('itemize', BULLET_PATTERN), ('enumerate', NUMBERED_PATTERN)):
+        match = pattern.match(line)
+        if match:
+            if match.group('indent'):
+                raise NotConfident('nested list')
+            return kind, match
+    return None, None
+
+
+def _blocks(lines):
+    """Kelompokkan baris menjadi paragraf dan daftar: ('paragraph', [baris]) / (jenis daftar, [item])"""
+    blocks = []
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if not line.strip():
+            i += 1
+            continue
+        if UNSUPPORTED_LINE_PATTERN.match(line):
+            raise NotConfident('unsupported markdown')
+
+        kind, match = _list_item(line)
+        if kind is None:
+            paragraph = []
+            while i < len(lines) and lines[i].strip() and _list_item(lines[i])[0] is None:
+                if UNSUPPORTED_LINE_PATTERN.match(lines[i]):
+                    raise NotConfident('unsupported markdown')
+                paragraph.append(lines[i].strip())
+                i += 1
+            blocks.append(('paragraph', paragraph))
+            continue
+
+        if kind == 'enumerate' and match.group('number') != '1':
+            raise NotConfident('list does not start at 1')
+        items = [match.group('text').strip()]
+        i += 1
+        while i < len(lines):
+            line = lines[i]
+            if not line.strip():
+                # Baris kosong di antara item jenis yang sama tidak memutus daftar
+                j = i
+                while j < len(lines) and not lines[j].strip():
+                    j += 1
+                if j < len(lines) and _list_item(lines[j])[0] == kind:
+                    i = j
+                    continue
+                break
+            next_kind, next_match = _list_item(line)
+            if next_kind == kind:
+                items.append(next_match.group('text').strip())
+            elif next_kind is None and line[:1] in (' ', '\t'):
+                # Baris menjorok melanjutkan item sebelumnya
+                items[-1] += ' ' + line.strip()
+            else:
+                break
+            i += 1
+        blocks.append((kind, items))
+    return blocks
+
+
+def convert_simple(text):
+    """Konversi teks sederhana (paragraf, daftar berpoin/bernomor, tebal/miring, kode inline, URL)
+    ke LaTeX secara lokal. Mengembalikan None jika teks sebaiknya dikonversi oleh model."""
+    raw = unescape_client(text)
+    # Backslash atau ^ mentah biasanya berarti LaTeX/matematika yang sudah ditulis pengguna
+    if '\\' in raw or '^' in raw or not raw.strip():
+        return None
+    try:
+        output = []
+        for kind, content in _blocks(raw.replace('\r\n', '\n').split('\n')):
+            if kind == 'paragraph':
+                output.append('\n'.join(convert_inline(line) for line in content))
+            else:
+                items = '\n'.join(f"\\item {convert_inline(item)}" for item in content)
+                output.append(f"\\begin{{{kind}}}\n{items}\n\\end{{{kind}}}")
+    except NotConfident:
+        return None
+    return sanitize_latex('\n\n'.join(output))
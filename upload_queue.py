@@ -0,0 +1,86 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from telemetry import get_logger
+
+log = get_logger('upload_queue')
+
+
+class UploadQueue:
+    """Antrian upload latar belakang dengan retry (backoff eksponensial) dan status per file.
+
+    `handler(key, payload)` dijalankan di worker pool dan boleh dipanggil ulang saat retry,
+    `cleanup(key, payload)` dipanggil sekali setelah job selesai atau gagal permanen.
+    Jika `run_async` False, job dijalankan langsung di thread pemanggil.
+    """
+
+    def __init__(self, handler, cleanup=None, workers=4, max_attempts=3, backoff=1.0,
+                 run_async=True, keep_finished=1024):
+        self._handler = handler
+        self._cleanup = cleanup
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.keep_finished = keep_finished
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='upload') if run_async else None
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, key, payload):
+        with self._lock:
+            self._jobs[key] = {'status': 'queued', 'attempts': 0, 'error': None, 'payload': payload}
+            self._jobs.move_to_end(key)
+            self._trim()
+        if self._pool:
+            self._pool.submit(self._run, key)
+        else:
+            self._run(key)
+        return self.status(key)
+
+    def _trim(self):
+        finished = [key for key, job in self._jobs.items() if job['status'] in ('done', 'failed')]
+        for key in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self._jobs[key]
+
+    def _set(self, key, **fields):
+        with self._lock:
+            self._jobs[key].update(fields)
+
+    def _run(self, key):
+        job = self._jobs[key]
+        payload = job['payload']
+        while True:
+            attempts = job['attempts'] + 1
+            self._set(key, status='processing', attempts=attempts)
+            try:
+                self._handler(key, payload)
+                self._set(key, status='done', error=None)
+                break
+            except Exception as e:
+                log.warning("Upload %s failed (attempt %d/%d): %s", key, attempts, self.max_attempts, e)
+                if attempts >= self.max_attempts:
+                    self._set(key, status='failed', error=str(e))
+                    break
+                self._set(key, status='retrying', error=str(e))
+                time.sleep(self.backoff * 2 ** (attempts - 1))
+
+        self._set(key, payload=None)
+        if self._cleanup:
+            try:
+                self._cleanup(key, payload)
+            except Exception as e:
+                log.error("Error cleaning up upload %s: %s", key, e)
+
+    def status(self, key):
+        """Status job tanpa payload, None jika job tidak dikenal di proses ini"""
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is None:
+                return None
+            return {'status': job['status'], 'attempts': job['attempts'], 'error': job['error']}
+
+    def payload(self, key):
+        """Payload job yang belum selesai, None jika sudah selesai atau tidak dikenal"""
+        with self._lock:
+            job = self._jobs.get(key)
+            return job['payload'] if job else None
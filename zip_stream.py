@@ -0,0 +1,65 @@
+import io
+import time
+from zipfile import ZipFile, ZipInfo, ZIP_DEFLATED, ZIP_STORED
+
+
+class _ChunkSink(io.RawIOBase):
+    """File object tulis-saja yang menampung output ZipFile sampai diambil dengan drain()"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class ZipStream:
+    """Membangun arsip ZIP secara bertahap tanpa menahan seluruh arsip di memori.
+
+    Output tidak seekable, jadi ZipFile menulis data descriptor setelah setiap entry.
+    Setiap method add_* adalah generator yang menghasilkan potongan byte siap dikirim.
+    """
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self):
+        self._sink = _ChunkSink()
+        self._zip = ZipFile(self._sink, 'w', compression=ZIP_DEFLATED)
+
+    def add_bytes(self, arcname, data, compress=True):
+        with self._zip.open(self._info(arcname, compress), 'w') as entry:
+            for offset in range(0, len(data), self.CHUNK_SIZE):
+                entry.write(data[offset:offset + self.CHUNK_SIZE])
+                chunk = self._sink.drain()
+                if chunk:
+                    yield chunk
+        yield self._sink.drain()
+
+    def add_file(self, arcname, path, compress=False):
+        # Gambar PNG sudah terkompresi, default-nya disimpan apa adanya
+        with open(path, 'rb') as src, self._zip.open(self._info(arcname, compress), 'w') as entry:
+            for data in iter(lambda: src.read(self.CHUNK_SIZE), b''):
+                entry.write(data)
+                chunk = self._sink.drain()
+                if chunk:
+                    yield chunk
+        yield self._sink.drain()
+
+    def close(self):
+        self._zip.close()
+        yield self._sink.drain()
+
+    def _info(self, arcname, compress):
+        info = ZipInfo(arcname, date_time=time.localtime()[:6])
+        info.compress_type = ZIP_DEFLATED if compress else ZIP_STORED
+        return info